@@ -6,171 +6,678 @@ vendor.add('lib')
 
 
 # Import the Flask Framework
-from flask import Flask, render_template, request, current_app
+from flask import (Flask, Response, render_template, request, jsonify,
+                   abort, stream_with_context, g)
+from werkzeug.routing import BaseConverter
 app = Flask(__name__)
 
+import os
+import time
 import random
 import json
+import functools
+import threading
+import traceback
 
 from regex_generator import RegexCrosswordGenerator
+from puzzle import Puzzle
+from corpus import CORPORA, AVAILABLE_CORPORA
+from puzzle_pool import PuzzlePool
+from lru_cache import LRUCache
+from puzzle_store import PuzzleStore, DIFFICULTIES
+from puzzle_pack import PuzzlePack
+from hints import HintState
+from http_cache import payload, respond
+from resources import ResourceLoader
+from deadline import Deadline
+import metrics
+from profiling import Profile, FORMATS as PROFILE_FORMATS
+import regex_automaton
+
+
+class PuzzleIdConverter(BaseConverter):
+    """
+    Matches puzzle ids like 8x8-words-1f3a. The lower weight makes these
+    urls win over /puzzle/<difficulty>/.
+    """
+    regex = r"\d+x\d+-[a-z]+-[0-9a-f]+(?:-u)?"
+    weight = 50
+
+
+app.url_map.converters["puzzle_id"] = PuzzleIdConverter
+
+
+# A config file named by REGX_SETTINGS is loaded over these defaults. Set
+# values in app.config before the first request otherwise; the pools,
+# caches, store and packs are only built then (see setup).
+app.config.from_envvar("REGX_SETTINGS", silent=True)
+app.config.setdefault("PUZZLE_POOL_LOW_WATERMARK", 5)
+app.config.setdefault("PUZZLE_POOL_HIGH_WATERMARK", 20)
+app.config.setdefault("PUZZLE_POOL_WORKERS", 2)
+app.config.setdefault("PUZZLE_POOL_MAX_FAILURES", 3)
+app.config.setdefault("PUZZLE_POOL_BACKOFF", 60)
+app.config.setdefault("PUZZLE_CACHE_SIZE", 1024)
+app.config.setdefault("API_MAX_BATCH", 1000)
+app.config.setdefault("PUZZLE_DB", None)
+app.config.setdefault("PUZZLE_PACKS", {})
+app.config.setdefault("RESOURCE_RELOAD", False)
+app.config.setdefault("RESOURCE_RELOAD_INTERVAL", 2.0)
+app.config.setdefault("METRICS_ENABLED", False)
+app.config.setdefault("PROFILE_ALLOWLIST", ())
+app.config.setdefault("PROFILE_DIR", None)
+app.config.setdefault("PAGE_MAX_AGE", 3600)
+app.config.setdefault("PUZZLE_MAX_AGE", 86400)
+app.config.setdefault("GENERATION_BUDGET", 1.0)
+
+# Built from the config by setup().
+pool = None
+resources = None
+cache = None
+store = None
+packs = {}
+
+
+@app.before_first_request
+def setup():
+    """
+    Build the pools, caches, store and packs from app.config, once it is
+    final.
+    """
+    global pool, resources, cache, store, packs
+    if pool is not None:
+        return
+    pool = PuzzlePool(
+        low_watermark=app.config["PUZZLE_POOL_LOW_WATERMARK"],
+        high_watermark=app.config["PUZZLE_POOL_HIGH_WATERMARK"],
+        workers=app.config["PUZZLE_POOL_WORKERS"],
+        max_failures=app.config["PUZZLE_POOL_MAX_FAILURES"],
+        backoff=app.config["PUZZLE_POOL_BACKOFF"])
+
+    # Subheaders and the other files read at startup (see resources.py).
+    resources = ResourceLoader(
+        app.root_path, reload=app.config["RESOURCE_RELOAD"],
+        interval=app.config["RESOURCE_RELOAD_INTERVAL"])
+
+    # Rendered page shells, and the json, clues and hint states of
+    # recently served puzzles keyed by puzzle id.
+    cache = LRUCache(app.config["PUZZLE_CACHE_SIZE"])
+
+    # Pre-generated puzzles (see puzzle_store.py), served before
+    # generating any when a database is configured.
+    if app.config["PUZZLE_DB"]:
+        store = PuzzleStore(app.config["PUZZLE_DB"])
+
+    # Puzzle packs (see puzzle_pack.py) served instead of generating,
+    # keyed like the pools, e.g. {"expert": "expert.rxp"}.
+    packs = dict((key, PuzzlePack(path))
+                 for key, path in app.config["PUZZLE_PACKS"].items())
+
+    metrics.enable(app.config["METRICS_ENABLED"])
+
+
+def cache_metrics():
+    """
+    Hit and miss counters of the puzzle pools and caches, for /metrics.
+    """
+    caches = regex_automaton.cache_stats()
+    caches["puzzles"] = cache.stats()
+    for name, stats in caches.items():
+        for key in ("hits", "misses"):
+            yield ("cache_{}_total".format(key), "counter",
+                   {"cache": name}, stats[key])
+        yield "cache_size", "gauge", {"cache": name}, stats["size"]
+    for key, stats in pool.stats().items():
+        for name in ("hits", "misses", "generated", "errors"):
+            yield ("pool_{}_total".format(name), "counter",
+                   {"pool": key}, stats[name])
+        yield "pool_size", "gauge", {"pool": key}, stats["size"]
+
+
+metrics.add_collector(lambda: list(cache_metrics()))
+
+
+@app.before_request
+def start_timer():
+    if metrics.registry.enabled:
+        g.start = time.time()
+
+
+@app.after_request
+def record_request(response):
+    start = getattr(g, "start", None)
+    if start is not None:
+        endpoint = request.endpoint or "none"
+        metrics.observe("request", time.time() - start, endpoint=endpoint)
+        metrics.inc("requests", endpoint=endpoint,
+                    status=response.status_code)
+    return response
+
+
+@app.before_request
+def start_profile():
+    """
+    Profile this request if it asks for it with ?profile=pstats (or
+    collapsed, see profiling.py) or an X-Profile header, and comes from
+    an address in PROFILE_ALLOWLIST.
+    """
+    allowlist = app.config["PROFILE_ALLOWLIST"]
+    if not allowlist:
+        return
+    fmt = request.args.get("profile") or request.headers.get("X-Profile")
+    if fmt not in PROFILE_FORMATS or request.remote_addr not in allowlist:
+        return
+    g.profile = Profile(fmt)
+    g.profile.start()
+
+
+@app.after_request
+def finish_profile(response):
+    """
+    Return the profile instead of the response, or save it to PROFILE_DIR
+    and name the file in an X-Profile header.
+    """
+    profile = getattr(g, "profile", None)
+    if profile is None:
+        return response
+    profile.stop()
+    g.profile = None
+    directory = app.config["PROFILE_DIR"]
+    if directory is None:
+        return Response(profile.report(), mimetype="text/plain")
+    name = "{}-{:.0f}.{}".format(request.endpoint, time.time() * 1000,
+                                 "prof" if profile.format == "pstats"
+                                 else "txt")
+    profile.dump(os.path.join(directory, name))
+    response.headers["X-Profile"] = name
+    return response
+
+
+@app.teardown_request
+def stop_profile(exc=None):
+    profile = getattr(g, "profile", None)
+    if profile is not None:
+        profile.stop()
+
+
+def random_puzzle(min_size=2, max_size=10, width=None, height=None,
+                  band=None, **kwargs):
+    """
+    Generate a puzzle, picking any dimension not given at random. With a
+    score band (low, high) the puzzle is picked to score within it.
+    """
+    w = width or random.randint(min_size, max_size)
+    h = height or random.randint(min_size, max_size)
+    if band:
+        return RegexCrosswordGenerator.in_score_band(w, h, *band, **kwargs)
+    return RegexCrosswordGenerator(w, h, **kwargs)
+
+
+def new_puzzle(key, factory, query=None, band=None):
+    """
+    A puzzle for a route, as a Puzzle with its solution. This is
+    a random stored puzzle matching query (see PuzzleStore.count) if
+    there is one, then a random puzzle from the pack for key (scoring
+    within band, (low, high), if given), otherwise the next puzzle from
+    the pool for key, which is refilled by calling factory. factory takes
+    the deadline for generate_puzzle.
+    """
+    if store is not None and query is not None:
+        puzzle = store.random(**query)
+        if puzzle is not None:
+            metrics.inc("puzzle_source", source="store")
+            return Puzzle.from_dict(puzzle)
+    pack = packs.get(key)
+    if pack is not None:
+        low, high = band or (None, None)
+        puzzle = pack.random(min_score=low, max_score=high)
+        if puzzle is not None:
+            metrics.inc("puzzle_source", source="pack")
+            return Puzzle.from_dict(puzzle)
+    metrics.inc("puzzle_source", source="pool")
+    return pool.get(key, lambda: Puzzle.from_generator(factory()),
+                    lambda: generate_puzzle(factory))
+
+
+def generate_puzzle(factory):
+    """
+    Generate a puzzle for a request that found its pool empty, giving
+    the generator GENERATION_BUDGET seconds (see deadline.py). If it
+    fails, a fallback puzzle is served instead of an error.
+    """
+    budget = app.config["GENERATION_BUDGET"]
+    try:
+        x = factory(deadline=Deadline(budget) if budget else None)
+        return Puzzle.from_generator(x)
+    except Exception:
+        # Anything from a bad clue to a missing corpus file.
+        traceback.print_exc()
+        metrics.inc("generation_errors")
+        return fallback_puzzle()
+
+
+# Small puzzles generated and checked once, the last resort when
+# generating fails and there is nothing stored to serve instead.
+FALLBACK_SIZE = 4
+FALLBACK_SEEDS = range(8)
+_fallbacks = []
+_fallbacks_lock = threading.Lock()
+
+
+def fallback_puzzle():
+    """
+    Any stored puzzle, else a puzzle from any pack, else one of the small
+    fallback puzzles.
+    """
+    if store is not None:
+        puzzle = store.random()
+        if puzzle is not None:
+            metrics.inc("degraded", step="store")
+            return Puzzle.from_dict(puzzle)
+    for pack in packs.values():
+        if len(pack):
+            metrics.inc("degraded", step="pack")
+            return Puzzle.from_dict(pack.random())
+    with _fallbacks_lock:
+        if not _fallbacks:
+            for seed in FALLBACK_SEEDS:
+                try:
+                    x = RegexCrosswordGenerator(FALLBACK_SIZE, FALLBACK_SIZE,
+                                                seed=seed)
+                except AssertionError:
+                    continue
+                _fallbacks.append(Puzzle.from_generator(x))
+    metrics.inc("degraded", step="fallback")
+    return random.choice(_fallbacks)
+
+
+class PuzzleUnavailable(Exception):
+    """
+    A valid puzzle id that could not be rebuilt right now, because
+    generating it failed or ran past GENERATION_BUDGET.
+    """
+
+
+def find_puzzle(puzzle_id):
+    """
+    The Puzzle with this id, from the store if it is there, otherwise
+    rebuilt from the id within GENERATION_BUDGET seconds. Raises
+    ValueError for invalid ids and PuzzleUnavailable if the rebuild
+    fails or is cut short.
+    """
+    if store is not None:
+        puzzle = store.get(puzzle_id)
+        if puzzle is not None:
+            return Puzzle.from_dict(puzzle)
+    budget = app.config["GENERATION_BUDGET"]
+    try:
+        x = RegexCrosswordGenerator.from_puzzle_id(
+            puzzle_id, deadline=Deadline(budget) if budget else None)
+    except ValueError:
+        raise
+    except Exception:
+        traceback.print_exc()
+        metrics.inc("generation_errors")
+        raise PuzzleUnavailable(puzzle_id)
+    # A degraded rebuild is a different puzzle, don't serve it as this one.
+    if x.puzzle_id != puzzle_id:
+        metrics.inc("rebuilds_cut_short")
+        raise PuzzleUnavailable(puzzle_id)
+    return Puzzle.from_generator(x)
+
+
+def remember_clues(puzzle):
+    """
+    Keep the clues of a puzzle that was handed out so solutions can be
+    validated without rebuilding it.
+    """
+    if puzzle.id:
+        cache.put(("clues", puzzle.id), puzzle)
+
+
+def puzzle_clues(puzzle_id):
+    """
+    The Puzzle with this id, from the cache or found by id.
+    Raises ValueError for invalid ids and PuzzleUnavailable (see
+    find_puzzle).
+    """
+    puzzle = cache.get(("clues", puzzle_id))
+    if puzzle is None:
+        puzzle = find_puzzle(puzzle_id)
+        cache.put(("clues", puzzle_id), puzzle)
+    return puzzle
+
+
+def page_shell(header, data_url, next_url, double=False):
+    """
+    The page for a kind of puzzle. It holds no puzzle, the page fetches
+    one from data_url as json (and the next ones from next_url), so it
+    is rendered once, compressed once and cached by browsers for
+    PAGE_MAX_AGE seconds.
+    """
+    snapshot = resources.get()
+    key = ("shell", header, data_url, next_url, double, snapshot.mtimes)
+    shell = cache.get(key)
+    if shell is None:
+        with metrics.timer("render"):
+            shell = payload(render_template(
+                "index.html",
+                header=header,
+                subheaders=list(snapshot.subheaders),
+                data_url=data_url,
+                next_url=next_url,
+                double=double
+            ))
+        cache.put(key, shell)
+    return respond(shell, request, "text/html",
+                   max_age=app.config["PAGE_MAX_AGE"])
+
+
+def custom_puzzle():
+    w = request.args.get("w")
+    h = request.args.get("h")
+    w = max(min(int(w), 10), 2) if w else None
+    h = max(min(int(h), 10), 2) if h else None
+    key = "custom:{}x{}".format(w or "?", h or "?")
+    return new_puzzle(key, functools.partial(random_puzzle, width=w,
+                                             height=h), {
+        "width": w, "height": h, "corpus": "random",
+        "min_size": 2, "max_size": 10})
+
+
+def double_puzzle():
+    return new_puzzle("double", random_puzzle,
+                      {"difficulty": "random", "corpus": "random"})
+
+
+def more_expert_puzzle():
+    return new_puzzle(
+        "more_expert", functools.partial(RegexCrosswordGenerator, 12, 12),
+        {"width": 12, "height": 12, "corpus": "random"})
+
+
+def corpus_puzzle(corpus):
+    """
+    A puzzle made of real words from one of the bundled corpora.
+    """
+    return new_puzzle(corpus, functools.partial(
+        random_puzzle, use_real_words=True, textfile=CORPORA[corpus]), {
+        "corpus": corpus, "min_size": 2, "max_size": 10})
+
+
+def difficulty_puzzle(difficulty):
+    min_size, max_size, use_real_words, band = DIFFICULTIES[difficulty]
+    return new_puzzle(difficulty, functools.partial(
+        random_puzzle, min_size, max_size, band=band,
+        use_real_words=use_real_words), {
+        "difficulty": difficulty,
+        "corpus": "words" if use_real_words else "random"}, band)
+
+
+# The puzzle pages by the kind of puzzle /api/next/<kind> hands out:
+# (header, double, function returning a new puzzle).
+PAGES = {
+    "custom": ("Custom", False, custom_puzzle),
+    "double": ("Double Trouble", True, double_puzzle),
+    "more_expert": ("More Expert", False, more_expert_puzzle),
+}
+for _corpus in AVAILABLE_CORPORA - set(["words"]):
+    PAGES[_corpus] = (_corpus.capitalize(), False,
+                      functools.partial(corpus_puzzle, _corpus))
+for _difficulty in DIFFICULTIES:
+    PAGES[_difficulty] = (_difficulty.capitalize(), False,
+                          functools.partial(difficulty_puzzle, _difficulty))
+
+
+def page_route(kind):
+    if kind not in PAGES:
+        abort(404)
+    header, double, new = PAGES[kind]
+    url = "/api/next/{}".format(kind)
+    return page_shell(header, url, url, double)
 
 
 @app.route("/")
 def index_route():
-    return render_template("home.html")
+    return render_template("home.html", corpora=AVAILABLE_CORPORA)
 
 
 @app.route("/puzzle/")
 def puzzle_route():
-    with current_app.open_resource('subheaders.json') as f:
-        subheader = random.choice(json.load(f))
-    w = request.args.get("w")
-    h = request.args.get("h")
-    w = max(min(int(w or random.randint(2, 10)), 10), 2)
-    h = max(min(int(h or random.randint(2, 10)), 10), 2)
-    x = RegexCrosswordGenerator(w, h)
-    return render_template(
-        "index.html",
-        header="Custom",
-        subheader=subheader,
-        rows=zip(x.rows, x.rows2),
-        cols=zip(x.cols, x.cols2),
-        filler_row="0" * x.width,
-        filler_col="0" * x.height
-    )
+    return page_route("custom")
 
 
 @app.route("/puzzle/double/")
 def puzzle_double_route():
-    with current_app.open_resource('subheaders.json') as f:
-        subheader = random.choice(json.load(f))
-        w = random.randint(2, 10)
-        h = random.randint(2, 10)
-    x = RegexCrosswordGenerator(w, h)
-    return render_template(
-        "index.html",
-        header="Double Trouble",
-        subheader=subheader,
-        rows=zip(x.rows, x.rows2),
-        cols=zip(x.cols, x.cols2),
-        filler_row="0" * x.width,
-        filler_col="0" * x.height,
-        double=True
-    )
+    return page_route("double")
 
 
 @app.route("/puzzle/more_expert/")
 def puzzle_guru_route():
-    with current_app.open_resource('subheaders.json') as f:
-        subheader = random.choice(json.load(f))
-    x = RegexCrosswordGenerator(12, 12)
-    return render_template(
-        "index.html",
-        header="More Expert",
-        subheader=subheader,
-        rows=zip(x.rows, x.rows2),
-        cols=zip(x.cols, x.cols2),
-        filler_row="0" * x.width,
-        filler_col="0" * x.height
-    )
+    return page_route("more_expert")
 
 
 @app.route("/puzzle/alice/")
 def puzzle_alice_route():
-    with current_app.open_resource('subheaders.json') as f:
-        subheader = random.choice(json.load(f))
-    w = random.randint(2, 10)
-    h = random.randint(2, 10)
-    x = RegexCrosswordGenerator(
-        w, h, use_real_words=True, textfile="texts/Alice.txt")
-    return render_template(
-        "index.html",
-        header="Alice",
-        subheader=subheader,
-        rows=zip(x.rows, x.rows2),
-        cols=zip(x.cols, x.cols2),
-        filler_row="0" * x.width,
-        filler_col="0" * x.height
-    )
+    return page_route("alice")
 
 
 @app.route("/puzzle/shakespeare/")
 def puzzle_shakespeare_route():
-    with current_app.open_resource('subheaders.json') as f:
-        subheader = random.choice(json.load(f))
-    w = random.randint(2, 10)
-    h = random.randint(2, 10)
-    x = RegexCrosswordGenerator(
-        w, h, use_real_words=True, textfile="texts/Shakespeare.txt")
-    return render_template(
-        "index.html",
-        header="Shakespeare",
-        subheader=subheader,
-        rows=zip(x.rows, x.rows2),
-        cols=zip(x.cols, x.cols2),
-        filler_row="0" * x.width,
-        filler_col="0" * x.height
-    )
+    return page_route("shakespeare")
 
 
 @app.route("/puzzle/huck/")
 def puzzle_huck_route():
-    with current_app.open_resource('subheaders.json') as f:
-        subheader = random.choice(json.load(f))
-    w = random.randint(2, 10)
-    h = random.randint(2, 10)
-    x = RegexCrosswordGenerator(
-        w, h, use_real_words=True, textfile="texts/Huck.txt")
-    return render_template(
-        "index.html",
-        header="Huck",
-        subheader=subheader,
-        rows=zip(x.rows, x.rows2),
-        cols=zip(x.cols, x.cols2),
-        filler_row="0" * x.width,
-        filler_col="0" * x.height
-    )
+    return page_route("huck")
+
+
+@app.route("/puzzle/<puzzle_id:puzzle_id>/")
+def puzzle_id_route(puzzle_id):
+    """
+    The page for a shared puzzle. The same page serves every id, it
+    fetches /api/puzzle/<id>/ for the one in its url.
+    """
+    double = bool(request.args.get("double"))
+    return page_shell("Shared", None,
+                      "/api/next/{}".format("double" if double
+                                            else "random"), double)
 
 
 @app.route("/puzzle/<difficulty>/")
 def puzzle_route_difficulty(difficulty=None):
-    with current_app.open_resource('subheaders.json') as f:
-        subheader = random.choice(json.load(f))
-    if difficulty == "beginner":
-        w = random.randint(2, 4)
-        h = random.randint(2, 4)
-        use_real_words = True
-        header = "Beginner"
-    elif difficulty == "intermediate":
-        w = random.randint(5, 7)
-        h = random.randint(5, 7)
-        use_real_words = True
-        header = "Intermediate"
-    elif difficulty == "expert":
-        w = random.randint(8, 10)
-        h = random.randint(8, 10)
-        use_real_words = True
-        header = "Expert"
-    else:
+    if difficulty not in DIFFICULTIES:
         # Anything else or random
-        # If you're wondering why I set the limit to 10,
-        # this is the number of columns I could fit on my
-        # phone screen before I had to scroll to see the
-        # last column.
-        w = random.randint(2, 10)
-        h = random.randint(2, 10)
-        use_real_words = False
-        header = "Random"
-    x = RegexCrosswordGenerator(w, h, use_real_words=use_real_words)
-    return render_template(
-        "index.html",
-        header=header,
-        subheader=subheader,
-        rows=zip(x.rows, x.rows2),
-        cols=zip(x.cols, x.cols2),
-        filler_row="0" * x.width,
-        filler_col="0" * x.height
-    )
+        difficulty = "random"
+    return page_route(difficulty)
+
+
+def api_options():
+    """
+    Read the puzzle options shared by the json endpoints from the query
+    string. Missing dimensions are left as None to be picked at random.
+    """
+    w = request.args.get("w", type=int)
+    h = request.args.get("h", type=int)
+    w = max(min(w, 12), 2) if w else None
+    h = max(min(h, 12), 2) if h else None
+    corpus = request.args.get("corpus")
+    if corpus and corpus not in AVAILABLE_CORPORA:
+        abort(400)
+    kwargs = {"unique": bool(request.args.get("unique"))}
+    if corpus:
+        kwargs.update(use_real_words=True, textfile=CORPORA[corpus])
+    return w, h, corpus, kwargs
+
+
+def puzzle_json(puzzle, solution=False):
+    """
+    The puzzle as a compact json Payload (see http_cache.py), kept for
+    later requests for the same id.
+    """
+    data = payload(json.dumps(puzzle.to_dict(solution),
+                              separators=(",", ":")))
+    if puzzle.id:
+        cache.put(("json", puzzle.id, solution), data)
+    remember_clues(puzzle)
+    return data
+
+
+@app.route("/api/puzzle/")
+def api_puzzle_route():
+    w, h, corpus, kwargs = api_options()
+    key = "api:{}:{}x{}{}".format(corpus or "random", w or "?", h or "?",
+                                  ":unique" if kwargs["unique"] else "")
+    query = None
+    if not kwargs["unique"]:
+        query = {"width": w, "height": h, "corpus": corpus or "random",
+                 "min_size": 2, "max_size": 10}
+    puzzle = new_puzzle(key, functools.partial(
+        random_puzzle, width=w, height=h, **kwargs), query)
+    solution = bool(request.args.get("solution"))
+    return respond(puzzle_json(puzzle, solution), request,
+                   "application/json")
+
+
+@app.route("/api/puzzle/<puzzle_id:puzzle_id>/")
+def api_puzzle_id_route(puzzle_id):
+    solution = bool(request.args.get("solution"))
+    data = cache.get(("json", puzzle_id, solution))
+    if data is None:
+        try:
+            puzzle = find_puzzle(puzzle_id)
+        except ValueError:
+            abort(404)
+        except PuzzleUnavailable:
+            abort(503)
+        data = puzzle_json(puzzle, solution)
+    # A puzzle never changes once it has an id.
+    return respond(data, request, "application/json",
+                   max_age=app.config["PUZZLE_MAX_AGE"])
+
+
+@app.route("/api/next/<kind>")
+def api_next_route(kind):
+    """
+    A new puzzle for one of the puzzle pages (see PAGES), without its
+    solution. This is what the "New board" button fetches.
+    """
+    if kind not in PAGES:
+        abort(404)
+    header, double, new = PAGES[kind]
+    return respond(puzzle_json(new()), request, "application/json")
+
+
+@app.route("/api/puzzles")
+def api_puzzles_route():
+    """
+    Stream n puzzles as newline delimited json. Passing a seed makes the
+    whole batch reproducible.
+    """
+    w, h, corpus, kwargs = api_options()
+    n = max(min(request.args.get("n", 1, type=int),
+                app.config["API_MAX_BATCH"]), 1)
+    solution = bool(request.args.get("solution"))
+    rng = random.Random(request.args.get("seed", type=int))
+
+    def generate():
+        for i in xrange(n):
+            x = random_puzzle(width=w or rng.randint(2, 10),
+                              height=h or rng.randint(2, 10),
+                              seed=rng.getrandbits(32), **kwargs)
+            yield json.dumps(x.to_dict(solution=solution),
+                             separators=(",", ":")) + "\n"
+
+    return Response(stream_with_context(generate()),
+                    mimetype="application/x-ndjson")
+
+
+@app.route("/api/validate", methods=["POST"])
+def api_validate_route():
+    """
+    Check a solution server side. Takes json like
+    {"id": "8x8-words-1f3a", "grid": ["ROW1", ...], "double": false}
+    and reports which rows and cols fully match their clues. The second
+    set of clues is only checked for double puzzles.
+    """
+    body = request.get_json(force=True, silent=True)
+    if not isinstance(body, dict):
+        abort(400)
+    puzzle_id = body.get("id")
+    grid = body.get("grid")
+    if not isinstance(puzzle_id, basestring) or not isinstance(grid, list):
+        abort(400)
+    try:
+        puzzle = puzzle_clues(puzzle_id)
+    except ValueError:
+        abort(404)
+    except PuzzleUnavailable:
+        abort(503)
+    if (len(grid) != puzzle.height or
+            any(not isinstance(row, basestring) or len(row) != puzzle.width
+                for row in grid)):
+        abort(400)
+
+    with metrics.timer("validate"):
+        rows_ok, cols_ok = puzzle.check([row.upper() for row in grid],
+                                        bool(body.get("double")))
+    return jsonify(id=puzzle_id, valid=all(rows_ok) and all(cols_ok),
+                   rows=rows_ok, cols=cols_ok)
+
+
+@app.route("/api/puzzle/<puzzle_id:puzzle_id>/hint")
+def api_hint_route(puzzle_id):
+    """
+    The next cell to fill in. Takes the current grid as comma separated
+    rows, with any other character (like a space or a dot) for empty
+    cells, e.g. ?grid=AB.,..C,...&double=1, and returns the empty or
+    wrong cell with the fewest candidates left and its value.
+    """
+    double = bool(request.args.get("double"))
+    key = ("hint", puzzle_id, double)
+    state = cache.get(key)
+    if state is None:
+        try:
+            puzzle = puzzle_clues(puzzle_id)
+        except ValueError:
+            abort(404)
+        except PuzzleUnavailable:
+            abort(503)
+        if puzzle.solution is None:
+            abort(404)
+        rows, cols = puzzle.clue_lists(double)
+        state = HintState(puzzle.width, puzzle.height, rows, cols,
+                          puzzle.solution)
+        cache.put(key, state)
+
+    grid = request.args.get("grid", "").upper().split(",")
+    if grid == [""]:
+        grid = [""] * state.height
+    if (len(grid) != state.height or
+            any(len(row) > state.width for row in grid)):
+        abort(400)
+    hint = state.hint(grid)
+    if hint is None:
+        return jsonify(id=puzzle_id, solved=True)
+    row, col, value, candidates = hint
+    return jsonify(id=puzzle_id, solved=False, row=row, col=col,
+                   value=value, candidates=candidates)
+
+
+@app.route("/pool/stats/")
+def pool_stats_route():
+    return jsonify(pool.stats())
+
+
+@app.route("/metrics")
+def metrics_route():
+    """
+    Counters and timers in the Prometheus text format, when enabled with
+    METRICS_ENABLED.
+    """
+    if not metrics.registry.enabled:
+        abort(404)
+    return Response(metrics.render(),
+                    mimetype="text/plain; version=0.0.4")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Bound how long a backtracking regex engine can take to reject a clue.
+
+Python's re and the browsers' engines try every way of splitting a
+string between the quantifiers of a pattern before giving up on it. Two
+unbounded quantifiers next to each other over overlapping characters,
+like .*X?Y.+, give them O(n^2) splits to try on a string of length n,
+three give O(n^3), and a quantifier over ambiguous alternatives, like
+(A|AB|B)+, gives O(2^n).
+
+match_cost() estimates that worst case from the parse tree (see
+regex_automaton.parse), and guard() runs on every clue as it is
+generated: clues over MAX_STEPS are rewritten without their redundant
+quantifiers (.*X?Y.+ is the same as .*Y.+) or rejected. The fuzz command
+checks the estimate against the real thing by timing every clue of many
+puzzles on adversarial strings of the grid length:
+
+    $ python backtracking.py fuzz -n 200 -W 12 -H 12
+    $ python backtracking.py cost ".*X?Y.+" 12
+"""
+from __future__ import print_function
+
+import sys
+import time
+import random
+import argparse
+from collections import namedtuple
+
+from regex_automaton import (ALLOWED_CHARACTERS, ALL, BITS, chars,
+                             full_regex, parse, popcount, width)
+
+
+# Estimated backtracking steps a clue may take on a string of its line's
+# length. Python's re gets through this many in a few milliseconds.
+MAX_STEPS = 10 ** 5
+
+# degree: how many unbounded quantifiers compete for the same characters;
+# exponential: whether a quantifier repeats something ambiguous; steps:
+# the estimated worst case for a string of the given length.
+MatchCost = namedtuple("MatchCost", ["degree", "exponential", "steps"])
+
+
+def _chars(node):
+    """
+    The mask of every character a node can consume.
+    """
+    kind = node[0]
+    if kind == "set":
+        return node[1]
+    elif kind == "ref":
+        return ALL
+    elif kind in ("group", "rep"):
+        return _chars(node[1])
+    mask = 0
+    for item in node[1]:
+        mask |= _chars(item)
+    return mask
+
+
+def _first(node):
+    """
+    The mask of the characters a match of a node can start with.
+    """
+    kind = node[0]
+    if kind in ("set", "ref"):
+        return _chars(node)
+    elif kind in ("group", "rep"):
+        return _first(node[1])
+    elif kind == "alt":
+        mask = 0
+        for branch in node[1]:
+            mask |= _first(branch)
+        return mask
+    mask = 0
+    for item in node[1]:
+        mask |= _first(item)
+        if width(item)[0]:
+            break
+    return mask
+
+
+def _ambiguous(node):
+    """
+    Whether a node can match the same string in more than one way when
+    repeated: it matches the empty string, or it has alternatives that
+    start with the same character.
+    """
+    if not width(node)[0]:
+        return True
+    while node[0] == "group" or (node[0] == "cat" and len(node[1]) == 1):
+        node = node[1] if node[0] == "group" else node[1][0]
+    if node[0] != "alt":
+        return False
+    seen = 0
+    for branch in node[1]:
+        first = _first(branch)
+        if first & seen:
+            return True
+        seen |= first
+    return False
+
+
+def _degree(node):
+    """
+    (degree, exponential) of a node, see MatchCost.
+    """
+    kind = node[0]
+    if kind in ("set", "ref"):
+        return 0, False
+    elif kind == "group":
+        return _degree(node[1])
+    elif kind == "alt":
+        costs = map(_degree, node[1])
+        return max(d for d, e in costs), any(e for d, e in costs)
+    elif kind == "rep":
+        d, exponential = _degree(node[1])
+        if node[3] is None:
+            return d + 1, exponential or d > 0 or _ambiguous(node[1])
+        return d * node[3], exponential
+
+    # Neighbouring quantifiers split the characters they both accept
+    # between them in every possible way. A run of them only ends at an
+    # item none of them could have consumed instead.
+    best = run = 0
+    run_mask = 0
+    exponential = False
+    for item in node[1]:
+        d, e = _degree(item)
+        exponential = exponential or e
+        mask = _chars(item)
+        if d:
+            if run and mask & run_mask:
+                run += d
+                run_mask |= mask
+            else:
+                run, run_mask = d, mask
+        elif not mask & run_mask:
+            run, run_mask = 0, 0
+        best = max(best, run)
+    return best, exponential
+
+
+def _binomial(n, k):
+    result = 1
+    for i in xrange(1, k + 1):
+        result = result * (n - k + i) // i
+    return result
+
+
+def match_cost(pattern, length):
+    """
+    The estimated worst case cost of matching pattern against a string
+    of the given length with a backtracking engine.
+    """
+    degree, exponential = _degree(parse(pattern))
+    # d competing quantifiers can split n characters in C(n + d, d) ways.
+    steps = _binomial(length + degree, degree)
+    if exponential:
+        steps = max(steps, 2 ** length)
+    return MatchCost(degree, exponential, steps)
+
+
+def _single(node):
+    """
+    The mask of a repetition of a single character set, or None.
+    """
+    if node[0] == "rep" and node[1][0] == "set":
+        return node[1][1]
+    return None
+
+
+def _simplify(node):
+    """
+    The node without repeated alternatives, and without optional
+    repetitions that a neighbouring unbounded one already covers: S*X?
+    and X*S+ match the same strings as S* and S+ when S accepts every
+    character X does.
+    """
+    kind = node[0]
+    if kind == "group":
+        return ("group", _simplify(node[1]), node[2])
+    elif kind == "rep":
+        return ("rep", _simplify(node[1])) + node[2:]
+    elif kind == "alt":
+        branches = []
+        for branch in map(_simplify, node[1]):
+            if branch not in branches:
+                branches.append(branch)
+        if len(branches) == 1:
+            return branches[0]
+        return ("alt", branches)
+    elif kind != "cat":
+        return node
+    items = map(_simplify, node[1])
+    i = 0
+    while i < len(items):
+        mask = _single(items[i])
+        if mask is not None and items[i][2] == 0:
+            for j in (i - 1, i + 1):
+                if not 0 <= j < len(items) or items[j][0] != "rep":
+                    continue
+                other = _single(items[j])
+                if (other is not None and items[j][3] is None and
+                        not mask & ~other):
+                    del items[i]
+                    i = max(i - 2, -1)
+                    break
+        i += 1
+    return ("cat", items)
+
+
+def _unparse(node):
+    kind = node[0]
+    if kind == "set":
+        mask = node[1]
+        if mask == ALL:
+            return "."
+        if popcount(mask) == 1:
+            return chars(mask)[0]
+        if popcount(mask) * 2 > len(ALLOWED_CHARACTERS):
+            return "[^" + "".join(sorted(chars(ALL & ~mask))) + "]"
+        return "[" + "".join(sorted(chars(mask))) + "]"
+    elif kind == "ref":
+        return "\\{}".format(node[1])
+    elif kind == "group":
+        return "(" + _unparse(node[1]) + ")"
+    elif kind == "alt":
+        return "|".join(map(_unparse, node[1]))
+    elif kind == "cat":
+        return "".join(map(_unparse, node[1]))
+    low, high = node[2], node[3]
+    suffix = {(0, 1): "?", (0, None): "*", (1, None): "+"}.get(
+        (low, high), "{{{}}}".format(low))
+    return _unparse(node[1]) + suffix
+
+
+def simplify(pattern):
+    """
+    The pattern without redundant alternatives and optional repetitions
+    (see _simplify), or the pattern itself if it has none.
+    """
+    tree = parse(pattern)
+    simpler = _simplify(tree)
+    if simpler == tree:
+        return pattern
+    return _unparse(simpler)
+
+
+def guard(pattern, length, max_steps=MAX_STEPS):
+    """
+    The pattern if matching it against strings of the given length is
+    cheap enough, otherwise a simplified equivalent that is, otherwise
+    None.
+    """
+    # Unless a group is repeated a fixed number of times the degree is at
+    # most the number of quantifiers, so short lines need no parsing.
+    quantifiers = pattern.count("*") + pattern.count("+")
+    if ("){" not in pattern and
+            _binomial(length + quantifiers, quantifiers) <= max_steps and
+            ("(" not in pattern or 2 ** length <= max_steps)):
+        return pattern
+    if match_cost(pattern, length).steps <= max_steps:
+        return pattern
+    simpler = simplify(pattern)
+    if simpler != pattern and match_cost(simpler, length).steps <= max_steps:
+        return simpler
+    return None
+
+
+##########################################
+# FUZZING
+##########################################
+
+def adversarial_strings(pattern, answer, rng, count=20):
+    """
+    Strings of the answer's length that a backtracking engine is slow to
+    reject: runs of the characters the pattern accepts ending in one it
+    may not, and near misses of the answer.
+    """
+    n = len(answer)
+    alphabet = sorted(set(c for c in pattern if c in BITS) | set(answer))
+    strings = set()
+    for c in alphabet:
+        strings.add(c * n)
+        for d in alphabet + [rng.choice(ALLOWED_CHARACTERS)]:
+            strings.add(c * (n - 1) + d)
+    for i in xrange(n):
+        wrong = rng.choice(ALLOWED_CHARACTERS.replace(answer[i], ""))
+        strings.add(answer[:i] + wrong + answer[i + 1:])
+    for i in xrange(count):
+        strings.add("".join(rng.choice(alphabet) for j in xrange(n)))
+    return sorted(strings)
+
+
+def worst_match_time(pattern, strings, repeat=3):
+    """
+    The longest time (best of repeat) full_regex(pattern) takes on any of
+    the strings, and that string.
+    """
+    regex = full_regex(pattern)
+    worst, worst_string = 0.0, None
+    for string in strings:
+        best = None
+        for i in xrange(repeat):
+            start = time.time()
+            regex.match(string)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        if best > worst:
+            worst, worst_string = best, string
+    return worst, worst_string
+
+
+def fuzz(n, w, h, seed=None, **kwargs):
+    """
+    Yield (seconds, pattern, string, cost) for the slowest adversarial
+    string of every clue of n generated puzzles.
+    """
+    from regex_generator import RegexCrosswordGenerator
+    rng = random.Random(seed)
+    for i in xrange(n):
+        x = RegexCrosswordGenerator(w, h, seed=rng.getrandbits(32),
+                                    **kwargs)
+        grid = x.possible_solution
+        columns = ["".join(col) for col in zip(*grid)]
+        lines = (zip(x.rows, grid) + zip(x.rows2, grid) +
+                 zip(x.cols, columns) + zip(x.cols2, columns))
+        for regex, answer in lines:
+            strings = adversarial_strings(regex.pattern, answer, rng)
+            seconds, string = worst_match_time(regex.pattern, strings)
+            yield (seconds, regex.pattern, string,
+                   match_cost(regex.pattern, len(answer)))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command")
+
+    cost = commands.add_parser("cost", help="Estimate the cost of a clue.")
+    cost.add_argument("pattern")
+    cost.add_argument("length", type=int)
+
+    fuzzing = commands.add_parser(
+        "fuzz", help="Time generated clues on adversarial strings.")
+    fuzzing.add_argument("-n", "--count", type=int, default=100)
+    fuzzing.add_argument("-W", "--width", type=int, default=12)
+    fuzzing.add_argument("-H", "--height", type=int, default=12)
+    fuzzing.add_argument("--seed", type=int)
+    fuzzing.add_argument("--top", type=int, default=10,
+                         help="Slowest clues to print.")
+    fuzzing.add_argument("--limit-ms", type=float, default=1.0,
+                         help="Exit with status 1 if any match took "
+                              "longer.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "cost":
+        cost = match_cost(args.pattern, args.length)
+        print("degree {}, {}exponential, ~{} steps".format(
+            cost.degree, "" if cost.exponential else "not ", cost.steps))
+        safe = guard(args.pattern, args.length)
+        if safe != args.pattern:
+            print("guarded: {}".format(safe))
+        return 0
+
+    results = sorted(fuzz(args.count, args.width, args.height, args.seed),
+                     reverse=True)
+    for seconds, pattern, string, cost in results[:args.top]:
+        print("{:8.1f} us  {:>8} steps  {}  on {}".format(
+            seconds * 1e6, cost.steps, pattern, string))
+    print("{} clues, slowest {:.1f} us".format(
+        len(results), results[0][0] * 1e6 if results else 0),
+        file=sys.stderr)
+    if results and results[0][0] * 1000 > args.limit_ms:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Generate large batches of puzzles across all cores.
+
+Every puzzle gets its own seed drawn from one batch seed, so a batch is
+reproducible no matter how the work is split between processes. Workers
+load the corpus once when they start instead of receiving it with every
+task.
+
+    $ python batch.py -n 10000 -W 8 -H 8 --seed 42 > pack.ndjson
+"""
+from __future__ import print_function
+
+import sys
+import json
+import random
+import argparse
+import multiprocessing
+
+from corpus import load_corpus, CORPORA, AVAILABLE_CORPORA
+from regex_generator import RegexCrosswordGenerator
+
+
+_options = None
+
+
+def _init_worker(options):
+    global _options
+    _options = options
+    if options["use_real_words"]:
+        load_corpus(options["textfile"])
+
+
+def _generate(seed):
+    options = _options
+    x = RegexCrosswordGenerator(
+        options["width"], options["height"],
+        use_real_words=options["use_real_words"],
+        textfile=options["textfile"], seed=seed, unique=options["unique"])
+    return x.to_dict(solution=options["solution"])
+
+
+def batch_seeds(count, seed=None):
+    """
+    The per-puzzle seeds for a batch.
+    """
+    rng = random.Random(seed)
+    for i in xrange(count):
+        yield rng.getrandbits(32)
+
+
+def generate_batch(count, width, height, use_real_words=False,
+                   textfile="texts/words.txt", seed=None, processes=None,
+                   ordered=True, solution=True, unique=False, chunksize=32):
+    """
+    Yield count puzzles as dicts (see RegexCrosswordGenerator.to_dict).
+
+    Puzzles are yielded in seed order when ordered is True, otherwise as
+    soon as any worker finishes one. processes defaults to the number of
+    cores; 1 generates everything in this process.
+    """
+    options = {
+        "width": width,
+        "height": height,
+        "use_real_words": use_real_words,
+        "textfile": textfile,
+        "solution": solution,
+        "unique": unique,
+    }
+    seeds = batch_seeds(count, seed)
+    if processes == 1:
+        _init_worker(options)
+        for s in seeds:
+            yield _generate(s)
+        return
+
+    pool = multiprocessing.Pool(processes, initializer=_init_worker,
+                                initargs=(options,))
+    try:
+        imap = pool.imap if ordered else pool.imap_unordered
+        for puzzle in imap(_generate, seeds, chunksize):
+            yield puzzle
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--count", type=int, default=1000)
+    parser.add_argument("-W", "--width", type=int, default=8)
+    parser.add_argument("-H", "--height", type=int, default=8)
+    parser.add_argument("--corpus", choices=sorted(AVAILABLE_CORPORA),
+                        help="Use real words from this corpus.")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("-j", "--processes", type=int,
+                        help="Worker processes (default: one per core).")
+    parser.add_argument("--unordered", action="store_true",
+                        help="Write puzzles as soon as they are ready.")
+    parser.add_argument("--unique", action="store_true",
+                        help="Tighten clues until puzzles have one solution.")
+    parser.add_argument("--no-solution", action="store_true")
+    parser.add_argument("-o", "--output", type=argparse.FileType("w"),
+                        default=sys.stdout)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    puzzles = generate_batch(
+        args.count, args.width, args.height,
+        use_real_words=bool(args.corpus),
+        textfile=CORPORA.get(args.corpus, "texts/words.txt"),
+        seed=args.seed, processes=args.processes,
+        ordered=not args.unordered, solution=not args.no_solution,
+        unique=args.unique)
+    for puzzle in puzzles:
+        args.output.write(json.dumps(puzzle, separators=(",", ":")) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Benchmark puzzle generation.
+
+Times RegexCrosswordGenerator.reset for every grid size with random
+characters and with each corpus, and every registered pattern on its own
+for each string length it supports. Reports throughput, p50/p95/p99
+latency and the allocations of a call: the peak bytes allocated where
+tracemalloc is available (Python 3), otherwise how many more objects
+gc.get_objects() holds after the call. Saved results record which in
+meta["alloc_method"]. The first error of each benchmark is printed to
+stderr.
+
+    $ python benchmark.py --save baseline.json
+    $ python benchmark.py --compare baseline.json
+
+--memory also reports the bytes a puzzle holds on to, kept as a
+generator, as a dict from to_dict() and as a Puzzle record (puzzle.py).
+"""
+from __future__ import print_function
+
+import gc
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import traceback
+import types
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# How allocations are measured, the key they are saved under and the
+# column they are shown in.
+if tracemalloc is not None:
+    ALLOC_METHOD, ALLOC_KEY, ALLOC_COLUMN = ("tracemalloc", "alloc_bytes",
+                                             "alloc B")
+else:
+    ALLOC_METHOD, ALLOC_KEY, ALLOC_COLUMN = ("gc_objects", "alloc_objects",
+                                             "alloc objs")
+
+from corpus import load_corpus, CORPORA, AVAILABLE_CORPORA
+from regex_generator import RegexCrosswordGenerator
+from puzzle import Puzzle
+
+
+MIN_SIZE = 2
+MAX_SIZE = 12
+
+# Corpora whose text files ship with the app.
+BENCH_CORPORA = tuple(sorted(AVAILABLE_CORPORA))
+
+
+def percentile(sorted_values, p):
+    """
+    Nearest rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    k = max(int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(k, len(sorted_values) - 1)]
+
+
+def _print_error(name):
+    print("{} failed:".format(name or "benchmark"), file=sys.stderr)
+    traceback.print_exc()
+
+
+def measure(func, iterations, name=None):
+    """
+    Call func() iterations times and summarize the timings. func gets the
+    iteration number. The traceback of the first error is printed.
+    """
+    times = []
+    errors = 0
+    gc.collect()
+    for i in xrange(iterations):
+        start = time.time()
+        try:
+            func(i)
+        except Exception:
+            if not errors:
+                _print_error(name)
+            errors += 1
+        times.append(time.time() - start)
+    times.sort()
+    total = sum(times)
+
+    # Tracing slows everything down, so allocations are measured on one
+    # extra call outside the timed ones. Without tracemalloc, the objects
+    # a call leaves behind are counted instead.
+    if tracemalloc is not None:
+        tracemalloc.start()
+    else:
+        gc.collect()
+        before = len(gc.get_objects())
+    try:
+        func(iterations)
+    except Exception:
+        if not errors:
+            _print_error(name)
+    if tracemalloc is not None:
+        alloc = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    else:
+        gc.collect()
+        alloc = max(len(gc.get_objects()) - before, 0)
+
+    return {
+        "n": iterations,
+        "errors": errors,
+        "ops_per_sec": iterations / total if total else None,
+        "p50_ms": percentile(times, 50) * 1000,
+        "p95_ms": percentile(times, 95) * 1000,
+        "p99_ms": percentile(times, 99) * 1000,
+        ALLOC_KEY: alloc,
+    }
+
+
+def reset_benchmarks(sizes, corpora, iterations, seed):
+    x = RegexCrosswordGenerator(2, 2, seed=seed)
+    for corpus in corpora:
+        if corpus != "random":
+            load_corpus(CORPORA[corpus])
+        for w, h in sizes:
+            kwargs = {}
+            if corpus != "random":
+                kwargs = {"use_real_words": True,
+                          "textfile": CORPORA[corpus]}
+
+            def run(i, w=w, h=h, kwargs=kwargs):
+                x.reset(w, h, seed=seed + i, **kwargs)
+
+            name = "reset/{}/{}x{}".format(corpus, w, h)
+            yield name, measure(run, iterations, name)
+
+
+def _sample_string(rng, strategy, length):
+    """
+    A random string of the given length that the strategy supports, or
+    None.
+    """
+    chars = RegexCrosswordGenerator.ALLOWED_CHARACTERS
+    string = rng.sample(chars, length)
+    if strategy.needs_duplicates:
+        string[-1] = string[0]
+    string = "".join(string)
+    if strategy.supports(length, len(set(string))):
+        return string
+    return None
+
+
+def pattern_benchmarks(iterations, seed):
+    rng = random.Random(seed)
+    x = RegexCrosswordGenerator(2, 2, seed=seed)
+    for strategy in RegexCrosswordGenerator.patterns:
+        for length in xrange(MIN_SIZE, MAX_SIZE + 1):
+            strings = [_sample_string(rng, strategy, length)
+                       for i in xrange(iterations + 1)]
+            if None in strings:
+                continue
+
+            def run(i, strategy=strategy, strings=strings):
+                strategy.func(x, strings[i], end=x._random.choice("+*"))
+
+            name = "pattern/{}/{}".format(strategy.name, length)
+            yield name, measure(run, iterations, name)
+
+
+# Shared by every object, so not counted as part of any.
+_SHARED_TYPES = (type, types.ModuleType, types.FunctionType,
+                 types.BuiltinFunctionType, types.MethodType)
+
+
+def deep_size(obj, seen):
+    """
+    The bytes sys.getsizeof gives for obj and everything it refers to,
+    skipping objects in seen (ids) and adding the ones counted to it.
+    """
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _SHARED_TYPES):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return size
+
+
+def memory_benchmarks(sizes, count, seed):
+    """
+    Bytes per puzzle held by count puzzles of each size, kept as they come
+    out of the generator, as to_dict(solution=True) and as Puzzle records.
+    Strings shared between puzzles are counted once.
+    """
+    for w, h in sizes:
+        generators = [RegexCrosswordGenerator(w, h, seed=seed + i)
+                      for i in xrange(count)]
+        kinds = (
+            ("generator", generators),
+            ("dict", [x.to_dict(solution=True) for x in generators]),
+            ("record", [Puzzle.from_generator(x) for x in generators]),
+        )
+        for kind, puzzles in kinds:
+            seen = set()
+            total = sum(deep_size(puzzle, seen) for puzzle in puzzles)
+            yield ("memory/{}/{}x{}".format(kind, w, h),
+                   {"n": count, "bytes_per_puzzle": total // count})
+
+
+def compare(baseline, results, threshold):
+    """
+    The benchmarks that got more than threshold (a fraction) slower at
+    the median than in the baseline.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if not base or not base.get("p50_ms") or not result.get("p50_ms"):
+            continue
+        ratio = result["p50_ms"] / base["p50_ms"]
+        if ratio > 1 + threshold:
+            regressions.append((name, base["p50_ms"], result["p50_ms"],
+                                ratio))
+    return regressions
+
+
+def parse_size(value):
+    if "-" in value:
+        low, high = value.split("-")
+        return int(low), int(high)
+    return int(value), int(value)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--iterations", type=int, default=20,
+                        help="Timed calls per benchmark.")
+    parser.add_argument("--sizes", type=parse_size,
+                        default=(MIN_SIZE, MAX_SIZE),
+                        help="Grid sizes to time, e.g. 2-12 or 8.")
+    parser.add_argument("--rectangles", action="store_true",
+                        help="Time every width x height pair, not just "
+                             "square grids.")
+    parser.add_argument("--corpus", action="append",
+                        choices=("random",) + BENCH_CORPORA,
+                        help="Only time these corpora (repeatable).")
+    parser.add_argument("--skip-resets", action="store_true")
+    parser.add_argument("--skip-patterns", action="store_true")
+    parser.add_argument("--memory", action="store_true",
+                        help="Also measure the bytes held per puzzle.")
+    parser.add_argument("--memory-count", type=int, default=200,
+                        help="Puzzles per size for --memory.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", metavar="FILE",
+                        help="Write the results as json.")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="Compare against results saved with --save.")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Slowdown that counts as a regression "
+                             "(default 0.2 for 20%%).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    low, high = args.sizes
+    sizes = [(w, h) for w in xrange(low, high + 1)
+             for h in xrange(low, high + 1) if args.rectangles or w == h]
+    corpora = args.corpus or ("random",) + BENCH_CORPORA
+
+    benchmarks = []
+    if not args.skip_resets:
+        benchmarks.append(reset_benchmarks(sizes, corpora, args.iterations,
+                                           args.seed))
+    if not args.skip_patterns:
+        benchmarks.append(pattern_benchmarks(args.iterations, args.seed))
+
+    results = {}
+    row = "{:<32} {:>10} {:>9} {:>9} {:>9} {:>7} {:>11}"
+    print(row.format("benchmark", "ops/s", "p50 ms", "p95 ms", "p99 ms",
+                     "errors", ALLOC_COLUMN))
+    for group in benchmarks:
+        for name, result in group:
+            results[name] = result
+            print(row.format(
+                name, "{:.1f}".format(result["ops_per_sec"] or 0),
+                "{:.3f}".format(result["p50_ms"]),
+                "{:.3f}".format(result["p95_ms"]),
+                "{:.3f}".format(result["p99_ms"]), result["errors"],
+                result[ALLOC_KEY]))
+            sys.stdout.flush()
+
+    if args.memory:
+        print("\n{:<32} {:>10}".format("memory", "B/puzzle"))
+        for name, result in memory_benchmarks(sizes, args.memory_count,
+                                              args.seed):
+            results[name] = result
+            print("{:<32} {:>10}".format(name, result["bytes_per_puzzle"]))
+            sys.stdout.flush()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "meta": {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "iterations": args.iterations,
+                    "seed": args.seed,
+                    "alloc_method": ALLOC_METHOD,
+                    "time": time.time(),
+                },
+                "results": results,
+            }, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(baseline, results, args.threshold)
+        for name, before, after, ratio in regressions:
+            print("REGRESSION {}: p50 {:.3f} ms -> {:.3f} ms ({:.0%} slower)"
+                  .format(name, before, after, ratio - 1))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
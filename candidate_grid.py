@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+The characters each cell of a grid may still take.
+
+A CandidateGrid keeps one mask over ALLOWED_CHARACTERS per cell (see
+regex_automaton.BITS) in a flat array, row by row. A whole set of row
+or col masks is intersected with the grid in one pass of
+map(operator.and_, ...), so the per cell work happens in C.
+
+Lines are numbered like the solver's: 0..height-1 are rows, the rest
+cols. line_cells() gives the cells of a line.
+"""
+from __future__ import print_function
+
+import operator
+from array import array
+
+from regex_automaton import ALLOWED_CHARACTERS, ALL
+
+
+# A signed 64 bit typecode holds every mask. Python 2 has no "q", but its
+# "l" is 64 bits on the platforms that matter; elsewhere plain lists are
+# used.
+if "q" in getattr(array, "typecodes", ""):
+    TYPECODE = "q"
+elif array("l").itemsize * 8 > len(ALLOWED_CHARACTERS):
+    TYPECODE = "l"
+else:
+    TYPECODE = None
+
+
+def _masks(values):
+    if TYPECODE is None:
+        return list(values)
+    return array(TYPECODE, values)
+
+
+def line_cells(width, height, line):
+    """
+    The cell indices (row by row) covered by a line of a width x height
+    grid. Lines 0..height-1 are rows, the rest are cols.
+    """
+    if line < height:
+        return range(line * width, line * width + width)
+    return range(line - height, width * height, width)
+
+
+class CandidateGrid(object):
+    """
+    A width x height grid of candidate masks, every character allowed
+    everywhere unless masks (row by row) are given.
+    """
+
+    __slots__ = ("width", "height", "masks")
+
+    def __init__(self, width, height, masks=None):
+        self.width = width
+        self.height = height
+        if masks is None:
+            masks = [ALL] * (width * height)
+        self.masks = _masks(masks)
+
+    def __len__(self):
+        return len(self.masks)
+
+    def __getitem__(self, i):
+        return self.masks[i]
+
+    def __iter__(self):
+        return iter(self.masks)
+
+    def intersect(self, rows=None, cols=None):
+        """
+        Narrow every cell by the masks of its row and col in one pass.
+        rows[r] and cols[c] are the masks of a whole row or col, e.g.
+        Automaton.positions(). Returns False if a cell is left empty.
+        """
+        masks = self.masks
+        if rows is not None:
+            flat = [m for row in rows for m in row]
+            masks = map(operator.and_, masks, flat)
+        if cols is not None:
+            flat = [m for row in zip(*cols) for m in row]
+            masks = map(operator.and_, masks, flat)
+        self.masks = _masks(masks)
+        return 0 not in self.masks
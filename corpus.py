@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Word corpora used for the real word puzzles.
+
+Each text file is read, normalized and indexed once per process. Every
+generator shares the same immutable Corpus afterwards, so requests never
+touch the disk for words.
+"""
+from __future__ import print_function
+
+import os
+import threading
+
+import metrics
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Short names for the corpora that ship with the app. These are used in
+# puzzle ids, so existing names should never change meaning.
+CORPORA = {
+    "words": "texts/words.txt",
+    "alice": "texts/Alice.txt",
+    "huck": "texts/Huck.txt",
+    "shakespeare": "texts/Shakespeare.txt",
+}
+
+# The corpora whose text files are actually there. Puzzles are only made
+# from, and ids only accepted for, these; the texts are never reloaded,
+# so this is checked once.
+AVAILABLE_CORPORA = frozenset(
+    name for name, path in CORPORA.items()
+    if os.path.isfile(os.path.join(ROOT, path)))
+
+
+class Corpus(object):
+    """
+    An immutable, deduplicated sequence of uppercase alphanumeric words.
+    """
+
+    __slots__ = ("_name", "_words")
+
+    def __init__(self, name, words):
+        self._name = name
+        self._words = tuple(words)
+
+    @classmethod
+    def from_text(cls, name, text):
+        """
+        Normalize raw text into a corpus. Words are uppercased, anything
+        that is not alphanumeric is dropped and duplicates are removed
+        while keeping the order of first appearance.
+        """
+        seen = set()
+        words = []
+        for word in text.split():
+            word = word.strip().upper()
+            if word.isalnum() and word not in seen:
+                seen.add(word)
+                words.append(word)
+        return cls(name, words)
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def words(self):
+        return self._words
+
+    def __len__(self):
+        return len(self._words)
+
+    def __getitem__(self, i):
+        return self._words[i]
+
+    def __iter__(self):
+        return iter(self._words)
+
+    def __setattr__(self, name, value):
+        if hasattr(self, "_words"):
+            raise AttributeError("Corpus objects are immutable")
+        object.__setattr__(self, name, value)
+
+
+def corpus_name(textfile):
+    """
+    The short name of a bundled corpus, or None for any other file.
+    """
+    for name, path in CORPORA.items():
+        if path == textfile:
+            return name
+    return None
+
+
+_corpora = {}
+_lock = threading.Lock()
+
+
+def load_corpus(textfile):
+    """
+    Get the corpus for a text file relative to the app root, loading it
+    on first use. Safe to call from any thread.
+    """
+    corpus = _corpora.get(textfile)
+    if corpus is None:
+        with _lock:
+            corpus = _corpora.get(textfile)
+            if corpus is None:
+                with metrics.timer("corpus_load"):
+                    with open(os.path.join(ROOT, textfile)) as f:
+                        corpus = Corpus.from_text(textfile, f.read())
+                _corpora[textfile] = corpus
+    return corpus
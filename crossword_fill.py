@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Fill a grid so that every row and col is a word from a corpus.
+
+Words are bucketed by length. For every length, position and character
+the index keeps the set of words with that character at that position as
+an int bitset, so narrowing a line down to the words that still fit its
+cells takes a few bitwise ands. Each cell holds a mask of the characters
+it may still take, as in solver. Lines and cells are narrowed against
+each other until nothing changes, then the search branches on the cell
+with the fewest characters left.
+
+The search is bounded by a number of nodes rather than by a clock, so
+the same random state always gives the same fill, or the same failure.
+"""
+from __future__ import print_function
+
+import binascii
+import threading
+
+from candidate_grid import line_cells
+from regex_automaton import ALL, BITS, chars, popcount
+
+
+# Search nodes tried before a fill is given up on.
+MAX_NODES = 60
+
+
+def _bitset(indices):
+    """
+    An int with the given (sorted) bit indices set.
+    """
+    if not indices:
+        return 0
+    data = bytearray(indices[-1] // 8 + 1)
+    for i in indices:
+        data[i >> 3] |= 1 << (i & 7)
+    data.reverse()
+    return int(binascii.hexlify(data), 16)
+
+
+class WordIndex(object):
+    """
+    Words of one length, with a bitset of word indices for every
+    character at every position.
+    """
+
+    __slots__ = ("length", "words", "all", "_positions", "_letters")
+
+    def __init__(self, words, length):
+        self.length = length
+        self.words = tuple(words)
+        self.all = (1 << len(self.words)) - 1
+        self._positions = []
+        self._letters = []
+        for p in xrange(length):
+            buckets = {}
+            for i, word in enumerate(self.words):
+                buckets.setdefault(BITS[word[p]], []).append(i)
+            self._positions.append(tuple(
+                (bit, _bitset(indices))
+                for bit, indices in sorted(buckets.items())))
+            self._letters.append(sum(buckets))
+
+    def narrow(self, p, mask, words):
+        """
+        The words in the bitset words whose character at position p is
+        in mask.
+        """
+        letters = self._letters[p]
+        if not letters & ~mask:
+            return words
+        if popcount(letters & mask) * 2 <= popcount(letters):
+            keep = 0
+            for bit, bits in self._positions[p]:
+                if bit & mask:
+                    keep |= bits
+            return words & keep
+        drop = 0
+        for bit, bits in self._positions[p]:
+            if not bit & mask:
+                drop |= bits
+        return words & ~drop
+
+    def letters(self, p, words, mask=ALL):
+        """
+        The characters in mask that appear at position p in any of the
+        words in the bitset words.
+        """
+        found = 0
+        for bit, bits in self._positions[p]:
+            if bit & mask and bits & words:
+                found |= bit
+        return found
+
+
+_lengths = {}
+_indexes = {}
+_lock = threading.Lock()
+
+
+def words_of_length(corpus, length):
+    """
+    The words of a corpus with the given length that only use allowed
+    characters, in corpus order. The corpus is bucketed by length on
+    first use.
+    """
+    buckets = _lengths.get(corpus.name)
+    if buckets is None:
+        with _lock:
+            buckets = _lengths.get(corpus.name)
+            if buckets is None:
+                buckets = {}
+                for word in corpus:
+                    if all(c in BITS for c in word):
+                        buckets.setdefault(len(word), []).append(word)
+                buckets = dict((n, tuple(words))
+                               for n, words in buckets.items())
+                _lengths[corpus.name] = buckets
+    return buckets.get(length, ())
+
+
+def word_index(corpus, length):
+    """
+    The WordIndex for the words of a length in a corpus, built on first
+    use. Safe to call from any thread.
+    """
+    key = (corpus.name, length)
+    index = _indexes.get(key)
+    if index is None:
+        words = words_of_length(corpus, length)
+        with _lock:
+            index = _indexes.get(key)
+            if index is None:
+                index = WordIndex(words, length)
+                _indexes[key] = index
+    return index
+
+
+class _OutOfNodes(Exception):
+    pass
+
+
+class GridFiller(object):
+    """
+    Fills a width x height grid with words from a corpus. No word is
+    used for two rows or for two cols.
+    """
+
+    def __init__(self, corpus, width, height, max_nodes=MAX_NODES):
+        self.width = width
+        self.height = height
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self._indexes = ([word_index(corpus, width)] * height +
+                         [word_index(corpus, height)] * width)
+        self._cells = [line_cells(width, height, line)
+                       for line in xrange(height + width)]
+
+    def fill(self, rng):
+        """
+        A list of row strings, or None if no fill was found within
+        max_nodes. rng orders the choices, so different states give
+        different fills.
+        """
+        if not all(index.words for index in self._indexes):
+            return None
+        domains = [ALL] * (self.width * self.height)
+        words = [index.all for index in self._indexes]
+        seen = [None] * len(words)
+        self.nodes = 0
+        if not self._propagate(domains, words, seen, range(len(words))):
+            return None
+        try:
+            return self._search(domains, words, seen, rng)
+        except _OutOfNodes:
+            return None
+
+    def _propagate(self, domains, words, seen, lines):
+        """
+        Narrow the word sets of lines and the masks of their cells in
+        place until they agree. seen holds the cell masks each line was
+        last narrowed by, so only the cells that changed since are looked
+        at again. Returns False on a contradiction.
+        """
+        w, h = self.width, self.height
+        queued = set(lines)
+        todo = list(lines)
+        while todo:
+            line = todo.pop()
+            queued.discard(line)
+            index = self._indexes[line]
+            cells = self._cells[line]
+            fits = words[line]
+            last = seen[line]
+            for p, i in enumerate(cells):
+                if last is None or domains[i] != last[p]:
+                    fits = index.narrow(p, domains[i], fits)
+            if not fits:
+                return False
+            if last is not None and fits == words[line]:
+                # Every cell still has a word for each of its characters.
+                seen[line] = [domains[i] for i in cells]
+                continue
+            words[line] = fits
+            for p, i in enumerate(cells):
+                if not domains[i] & (domains[i] - 1):
+                    continue
+                value = index.letters(p, fits, domains[i])
+                if value != domains[i]:
+                    domains[i] = value
+                    cross = h + i % w if line < h else i // w
+                    if cross not in queued:
+                        queued.add(cross)
+                        todo.append(cross)
+            seen[line] = [domains[i] for i in cells]
+        return True
+
+    def _grid(self, domains):
+        w = self.width
+        grid = ["".join(chars(domains[r * w + c])[0] for c in xrange(w))
+                for r in xrange(self.height)]
+        cols = ["".join(row[c] for row in grid) for c in xrange(w)]
+        if len(set(grid)) < len(grid) or len(set(cols)) < len(cols):
+            return None
+        return grid
+
+    def _search(self, domains, words, seen, rng):
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            raise _OutOfNodes()
+        best = None
+        best_count = len(BITS) + 1
+        for i, mask in enumerate(domains):
+            if mask & (mask - 1):
+                count = popcount(mask)
+                if count < best_count:
+                    best, best_count = i, count
+                    if count == 2:
+                        break
+        if best is None:
+            return self._grid(domains)
+
+        w = self.width
+        lines = [best // w, self.height + best % w]
+        options = chars(domains[best])
+        rng.shuffle(options)
+        for c in options:
+            branch = list(domains)
+            branch_words = list(words)
+            branch_seen = list(seen)
+            branch[best] = BITS[c]
+            if self._propagate(branch, branch_words, branch_seen, lines):
+                grid = self._search(branch, branch_words, branch_seen, rng)
+                if grid is not None:
+                    return grid
+        return None
+
+
+def fill_grid(corpus, width, height, rng, max_nodes=MAX_NODES):
+    """
+    Rows of a width x height grid whose rows and cols are all words from
+    corpus, or None if none was found within max_nodes search nodes.
+    """
+    return GridFiller(corpus, width, height, max_nodes).fill(rng)
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+A time budget for work done on behalf of a request.
+
+The generator checks a Deadline between its steps and takes cheaper
+paths as it runs out, rather than being interrupted:
+
+    deadline = Deadline(0.5)
+    x = RegexCrosswordGenerator(8, 8, deadline=deadline)
+    x.degraded  # e.g. ("tighten",) if tightening was given up
+"""
+from __future__ import print_function
+
+import time
+
+
+class Deadline(object):
+    """
+    A point in time some seconds from now.
+    """
+
+    __slots__ = ("seconds", "start", "end")
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.start = time.time()
+        self.end = self.start + seconds
+
+    def elapsed(self):
+        return time.time() - self.start
+
+    def remaining(self):
+        return max(self.end - time.time(), 0.0)
+
+    def expired(self):
+        return time.time() >= self.end
+
+    def near(self, fraction=0.5):
+        """
+        Whether less than this fraction of the budget is left.
+        """
+        return self.end - time.time() < self.seconds * fraction
+
+    def __repr__(self):
+        return "Deadline({:.3f}s left)".format(self.remaining())
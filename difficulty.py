@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Estimate how hard a puzzle is from how tightly its clues pin down each
+cell.
+
+Every cell gets two masks of candidate characters: the direct one, from
+reading its row and col clue on their own (see Automaton.positions), and
+the propagated one, left after the solver has narrowed every line
+against its clue until nothing changes. A cell scores the share of the
+alphabet (in bits) that the propagated mask rules out, plus the share
+that only propagation rules out, which takes combining clues to see. So
+a cell scores 0 when anything goes, up to 1 when its clues spell it out
+and up to 2 when it has to be deduced. The puzzle score is the sum over
+its cells.
+"""
+from __future__ import print_function
+
+import math
+
+from regex_automaton import (ALLOWED_CHARACTERS, Automaton, automaton,
+                             popcount)
+from solver import Solver
+
+
+MAX_BITS = math.log(len(ALLOWED_CHARACTERS), 2)
+
+# Bits of uncertainty left by a mask with n characters, by n.
+_BITS = [0.0] + [math.log(n, 2)
+                 for n in xrange(1, len(ALLOWED_CHARACTERS) + 1)]
+
+
+def _pattern(clue):
+    return getattr(clue, "pattern", clue)
+
+
+def clue_tightness(clue, length):
+    """
+    How much a clue constrains each position of a line of this length on
+    its own, from 0 (any character) to 1 (a single character).
+    """
+    masks = automaton(_pattern(clue)).positions(length) or [0] * length
+    return [1 - _BITS[popcount(m)] / MAX_BITS for m in masks]
+
+
+def direct_candidates(width, height, rows, cols):
+    """
+    The mask of each cell (row by row) from its row and col clues read
+    on their own. rows[i] and cols[i] are lists of clues.
+    """
+    return list(Solver(width, height, rows, cols).candidates())
+
+
+def propagated_candidates(width, height, rows, cols):
+    """
+    The mask of each cell (row by row) once every line agrees with its
+    clues, or None if the clues contradict each other.
+    """
+    return _propagated(Solver(width, height, rows, cols))
+
+
+def _propagated(solver, direct=None):
+    domains = list(direct or solver.candidates())
+    if 0 in domains or not solver.propagate(domains):
+        return None
+    return domains
+
+
+def score(width, height, rows, cols):
+    """
+    The difficulty score of a puzzle, between 0 and twice its number of
+    cells. rows[i] and cols[i] are lists of clues (patterns or compiled).
+    """
+    # Most puzzles are scored once, before they are stored or served, so
+    # their automata would only push the ones in use out of the cache.
+    return solver_score(Solver(width, height, rows, cols,
+                               make_automaton=Automaton))
+
+
+def solver_score(solver):
+    """
+    The score of the puzzle a Solver was built for, see score(). Saves
+    compiling the clues again where a Solver is at hand.
+    """
+    direct = list(solver.candidates())
+    final = _propagated(solver, direct)
+    if final is None:
+        return None
+    total = 0.0
+    for d, f in zip(direct, final):
+        left = _BITS[popcount(f)]
+        total += (MAX_BITS - left) + (_BITS[popcount(d)] - left)
+    return total / MAX_BITS
+
+
+def puzzle_score(puzzle):
+    """
+    The score of a puzzle dict, worked out from its clues if it has none.
+    """
+    value = puzzle.get("score")
+    if value is None:
+        value = round(score(
+            puzzle["width"], puzzle["height"],
+            [[r] for r in puzzle["rows"]], [[c] for c in puzzle["cols"]]), 1)
+    return value
+
+
+def in_band(score, low=None, high=None):
+    """
+    Whether a score is between low and high, either of which can be None
+    to leave that end open.
+    """
+    return ((low is None or score >= low) and
+            (high is None or score <= high))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Hint the next cell of a partly filled puzzle.
+
+A HintState holds the candidate masks of every cell (see solver) after
+the clues and the player's correct entries have been propagated. Players
+mostly add entries between hints, so the masks of recent grids are kept
+by their correct entries, and a hint starts from the kept grid with the
+most entries that are all still in place, propagating only the lines of
+the new ones. Everyone playing a puzzle shares its HintState, but each
+player's grids go on from their own. With nothing to start from, like
+after a cleared or corrected cell, it starts over from the masks of the
+clues alone, which are worked out once per puzzle.
+"""
+from __future__ import print_function
+
+import threading
+from collections import OrderedDict
+
+from regex_automaton import ALL, BITS, popcount
+from solver import Solver
+
+
+class HintState(object):
+    """
+    Hints for one puzzle. rows[i] and cols[i] are lists of clues and
+    solution is a list of row strings. Safe to share between threads.
+    """
+
+    # Grids whose masks are kept, least recently used dropped first.
+    MAX_GRIDS = 32
+
+    def __init__(self, width, height, rows, cols, solution):
+        self.width = width
+        self.height = height
+        self.solution = solution
+        self._solver = Solver(width, height, rows, cols)
+        base = list(self._solver.candidates())
+        if 0 in base or not self._solver.propagate(base):
+            base = [ALL] * (width * height)
+        self._base = base
+        # Masks by the set of correct entries they were propagated from.
+        self._grids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _correct(self, grid):
+        """
+        The cells of grid (row by row) that match the solution.
+        """
+        w = self.width
+        return frozenset(r * w + c
+                   for r, (row, answer) in enumerate(zip(grid, self.solution))
+                   for c, (ch, want) in enumerate(zip(row, answer))
+                   if ch == want)
+
+    def _update(self, entries):
+        """
+        The masks once the entries (cells filled in correctly) are
+        propagated, starting from the kept grid with the most entries
+        that are all among them.
+        """
+        w, h = self.width, self.height
+        start = frozenset()
+        domains = self._base
+        for kept, masks in self._grids.iteritems():
+            if len(kept) > len(start) and kept <= entries:
+                start, domains = kept, masks
+        if start:
+            self._grids[start] = self._grids.pop(start)
+        if start == entries:
+            return list(domains)
+        domains = list(domains)
+        lines = set()
+        for i in entries - start:
+            domains[i] = BITS[self.solution[i // w][i % w]]
+            lines.update((i // w, h + i % w))
+        if not self._solver.propagate(domains, sorted(lines)):
+            # Only a wrong solution can contradict the clues; hint from
+            # the clues alone rather than fail.
+            return list(self._base)
+        self._grids[entries] = domains
+        while len(self._grids) > self.MAX_GRIDS:
+            self._grids.popitem(last=False)
+        return list(domains)
+
+    def hint(self, grid):
+        """
+        The most constrained cell of grid (a list of row strings) that is
+        empty or wrong, as (row, col, value, candidates), or None when
+        every cell is right.
+        """
+        entries = self._correct(grid)
+        with self._lock:
+            domains = self._update(entries)
+        best = None
+        best_count = None
+        for i, mask in enumerate(domains):
+            if i in entries:
+                continue
+            count = popcount(mask)
+            if best is None or count < best_count:
+                best, best_count = i, count
+                if count == 1:
+                    break
+        if best is None:
+            return None
+        r, c = divmod(best, self.width)
+        return r, c, self.solution[r][c], best_count
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Responses that browsers and CDNs can cache and revalidate.
+
+A Payload is a response body prepared once: the bytes, the same bytes
+gzip compressed, and an ETag. respond() picks the encoding the client
+accepts, answers If-None-Match with 304 Not Modified, and sets the
+Cache-Control for it.
+
+    page = payload(render_template("index.html"))
+    return respond(page, request, "text/html", max_age=3600)
+"""
+from __future__ import print_function
+
+import gzip
+import hashlib
+from io import BytesIO
+from collections import namedtuple
+
+from werkzeug.wrappers import Response
+
+
+# Smaller bodies are sent as they are, gzip would barely shrink them.
+GZIP_MIN_SIZE = 256
+
+# data: the body as bytes; gzipped: the body gzip compressed, or None if
+# it is too small to be worth it; etag: a hash of data.
+Payload = namedtuple("Payload", ["data", "gzipped", "etag"])
+
+
+def gzip_bytes(data, level=6):
+    """
+    data gzip compressed, with a zero mtime so the same data always
+    compresses to the same bytes.
+    """
+    out = BytesIO()
+    with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=level,
+                       mtime=0) as f:
+        f.write(data)
+    return out.getvalue()
+
+
+def payload(data):
+    """
+    A Payload for a str or unicode body.
+    """
+    if isinstance(data, unicode):
+        data = data.encode("utf-8")
+    gzipped = gzip_bytes(data) if len(data) >= GZIP_MIN_SIZE else None
+    return Payload(data, gzipped, hashlib.sha1(data).hexdigest()[:20])
+
+
+def respond(body, request, mimetype, max_age=None):
+    """
+    A response for a Payload. With a max_age it may be cached for that
+    many seconds and revalidated with its ETag after, without one it is
+    never stored.
+    """
+    gzipped = body.gzipped is not None and request.accept_encodings["gzip"]
+    response = Response(body.gzipped if gzipped else body.data,
+                        mimetype=mimetype)
+    response.vary.add("Accept-Encoding")
+    if gzipped:
+        response.content_encoding = "gzip"
+    if max_age is None:
+        response.cache_control.no_store = True
+        return response
+    # The two encodings are different bytes, so they need different tags.
+    response.set_etag(body.etag + ("-gz" if gzipped else ""))
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response.make_conditional(request)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Profile puzzle generation, offline or for a single request.
+
+Two kinds of profile are supported: "pstats", the deterministic cProfile
+report sorted by cumulative time, and "collapsed", stacks sampled every
+millisecond by a background thread in the folded format that
+flamegraph.pl and speedscope read ("outer;inner;leaf count" per line).
+
+The same seed always gives the same puzzle, so a slow generation can be
+rebuilt and profiled exactly from its seed or puzzle id:
+
+    $ python profiling.py -W 12 -H 12 --seed 0x1f3a
+    $ python profiling.py --id 12x12-random-1f3a --format collapsed
+"""
+from __future__ import print_function
+
+import sys
+import time
+import pstats
+import cProfile
+import argparse
+import threading
+from collections import Counter
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from corpus import CORPORA, AVAILABLE_CORPORA
+from regex_generator import RegexCrosswordGenerator
+
+
+FORMATS = ("pstats", "collapsed")
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return "{}:{}:{}".format(code.co_filename, code.co_firstlineno,
+                             code.co_name)
+
+
+class StackSampler(object):
+    """
+    Samples the stack of one thread every interval seconds from a
+    background thread and counts how often each stack was seen.
+    """
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.stacks = Counter()
+        self._ident = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def enable(self):
+        self._ident = threading.current_thread().ident
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name="stack-sampler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._ident)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return "".join("{} {}\n".format(stack, count)
+                       for stack, count in sorted(self.stacks.items()))
+
+
+class Profile(object):
+    """
+    A profiler of either format, started and stopped around the code to
+    profile.
+    """
+
+    def __init__(self, fmt="pstats"):
+        if fmt not in FORMATS:
+            raise ValueError("Unknown profile format {}".format(fmt))
+        self.format = fmt
+        if fmt == "pstats":
+            self._profiler = cProfile.Profile()
+        else:
+            self._profiler = StackSampler()
+        self.running = False
+
+    def start(self):
+        self._profiler.enable()
+        self.running = True
+
+    def stop(self):
+        if self.running:
+            self._profiler.disable()
+            self.running = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def report(self, sort="cumulative", limit=40):
+        """
+        The profile as text: the top limit functions by sort for pstats,
+        every sampled stack for collapsed.
+        """
+        if self.format == "collapsed":
+            return self._profiler.collapsed()
+        out = StringIO()
+        stats = pstats.Stats(self._profiler, stream=out)
+        stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def dump(self, path):
+        """
+        Save the profile, as a pstats file that pstats.Stats or snakeviz
+        can load, or as collapsed stacks.
+        """
+        if self.format == "pstats":
+            self._profiler.dump_stats(path)
+        else:
+            with open(path, "w") as f:
+                f.write(self._profiler.collapsed())
+
+
+def profile_generation(factory, fmt="pstats", repeat=1):
+    """
+    Profile calling factory() repeat times, e.g. to build one puzzle.
+    Returns the Profile and the time taken per call.
+    """
+    profile = Profile(fmt)
+    start = time.time()
+    with profile:
+        for i in xrange(repeat):
+            factory()
+    return profile, (time.time() - start) / repeat
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--id", help="Profile the puzzle with this id.")
+    parser.add_argument("-W", "--width", type=int, default=12)
+    parser.add_argument("-H", "--height", type=int, default=12)
+    parser.add_argument("--seed", type=lambda s: int(s, 0), default=0,
+                        help="Seed, decimal or 0x hex as in puzzle ids.")
+    parser.add_argument("--corpus", choices=sorted(AVAILABLE_CORPORA),
+                        help="Use real words from this corpus.")
+    parser.add_argument("--unique", action="store_true")
+    parser.add_argument("--format", choices=FORMATS, default="pstats")
+    parser.add_argument("-n", "--repeat", type=int, default=1,
+                        help="Generate the puzzle this many times.")
+    parser.add_argument("--sort", default="cumulative",
+                        help="pstats sort key.")
+    parser.add_argument("--limit", type=int, default=40,
+                        help="Functions to print for pstats.")
+    parser.add_argument("-o", "--output",
+                        help="Save the profile here instead of printing.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.id:
+        name = args.id
+        factory = lambda: RegexCrosswordGenerator.from_puzzle_id(args.id)
+    else:
+        kwargs = {"seed": args.seed, "unique": args.unique}
+        if args.corpus:
+            kwargs.update(use_real_words=True, textfile=CORPORA[args.corpus])
+        name = "{}x{} seed {:#x}".format(args.width, args.height, args.seed)
+        factory = lambda: RegexCrosswordGenerator(args.width, args.height,
+                                                  **kwargs)
+
+    try:
+        profile, seconds = profile_generation(factory, args.format,
+                                              args.repeat)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    print("{}: {:.2f} ms per puzzle".format(name, seconds * 1000),
+          file=sys.stderr)
+    if args.output:
+        profile.dump(args.output)
+    else:
+        sys.stdout.write(profile.report(args.sort, args.limit))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+A compact, immutable record of a generated puzzle.
+
+The pools and caches of the app hold many puzzles at once, so a Puzzle
+keeps only what a puzzle is: the clues as interned strings in tuples and
+the solution as one packed byte string, in __slots__. No regex is kept
+with it; check() compiles the clues on demand through the process wide
+cache of regex_automaton.full_regex, which every puzzle with the same
+clue shares.
+
+    puzzle = Puzzle.from_generator(RegexCrosswordGenerator(8, 8))
+    puzzle.check(["ROW1", ...])
+    json.dumps(puzzle.to_dict())
+
+`python benchmark.py --memory` compares the bytes held per puzzle with
+the generator and with to_dict().
+"""
+from __future__ import print_function
+
+try:
+    intern
+except NameError:
+    from sys import intern
+
+from regex_generator import check_grid
+
+
+def _pattern(pattern):
+    # Clues are ASCII. json gives unicode, which intern() does not take.
+    return intern(str(pattern))
+
+
+def _patterns(patterns):
+    return tuple(_pattern(p) for p in patterns)
+
+
+class Puzzle(object):
+    """
+    The clues, dimensions, score and optionally the solution of a puzzle.
+    Attributes are read only.
+    """
+
+    __slots__ = ("id", "width", "height", "score", "rows", "cols",
+                 "rows2", "cols2", "_solution")
+
+    def __init__(self, puzzle_id, width, height, rows, cols, rows2=(),
+                 cols2=(), score=None, solution=None):
+        set_ = object.__setattr__
+        set_(self, "id", str(puzzle_id) if puzzle_id else None)
+        set_(self, "width", width)
+        set_(self, "height", height)
+        set_(self, "score", score)
+        set_(self, "rows", _patterns(rows))
+        set_(self, "cols", _patterns(cols))
+        set_(self, "rows2", _patterns(rows2))
+        set_(self, "cols2", _patterns(cols2))
+        set_(self, "_solution",
+             "".join(solution).encode("ascii") if solution else None)
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        The puzzle from a dict like RegexCrosswordGenerator.to_dict().
+        """
+        return cls(data["id"], data["width"], data["height"], data["rows"],
+                   data["cols"], data.get("rows2", ()),
+                   data.get("cols2", ()), data.get("score"),
+                   data.get("solution"))
+
+    @classmethod
+    def from_generator(cls, x):
+        return cls.from_dict(x.to_dict(solution=True))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Puzzle is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Puzzle is immutable")
+
+    def __eq__(self, other):
+        if not isinstance(other, Puzzle):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name)
+                   for name in self.__slots__)
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    def __hash__(self):
+        return hash((self.id, self.rows, self.cols, self._solution))
+
+    def __reduce__(self):
+        return (Puzzle, (self.id, self.width, self.height, self.rows,
+                         self.cols, self.rows2, self.cols2, self.score,
+                         self.solution))
+
+    def __repr__(self):
+        return "Puzzle({!r}, {}x{})".format(self.id, self.width,
+                                            self.height)
+
+    @property
+    def solution(self):
+        """
+        The solution as a list of row strings, or None.
+        """
+        if self._solution is None:
+            return None
+        w = self.width
+        return [self._solution[i:i + w]
+                for i in xrange(0, len(self._solution), w)]
+
+    def clue_lists(self, double=False):
+        """
+        The clues of every row and col as lists, with the second set for
+        double puzzles.
+        """
+        if double:
+            return ([list(r) for r in zip(self.rows, self.rows2)],
+                    [list(c) for c in zip(self.cols, self.cols2)])
+        return [[r] for r in self.rows], [[c] for c in self.cols]
+
+    def check(self, grid, double=False):
+        """
+        Which rows and cols of grid (a list of row strings) match all of
+        their clues, as two lists of bools (see check_grid).
+        """
+        return check_grid(grid, *self.clue_lists(double))
+
+    def to_dict(self, solution=False):
+        """
+        The puzzle as plain data, like RegexCrosswordGenerator.to_dict().
+        """
+        data = {
+            "id": self.id,
+            "width": self.width,
+            "height": self.height,
+            "score": self.score,
+            "rows": list(self.rows),
+            "cols": list(self.cols),
+            "rows2": list(self.rows2),
+            "cols2": list(self.cols2),
+        }
+        if solution and self._solution is not None:
+            data["solution"] = self.solution
+        return data
@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Write puzzle packs to disk and read them back by index.
+
+A pack is a header, one record per puzzle and an index of record offsets:
+
+    header   RXPK, version, codec, 2 reserved bytes
+    records  4 byte length + the puzzle as lines of text (see
+             encode_puzzle), compressed on its own with the pack's codec
+    index    8 byte offset of every record
+    footer   8 byte index offset, 8 byte count, RXPKEND\\0
+
+Records are compressed one by one so any of them can be read without
+the others. The writer spools offsets to a temporary file while puzzles
+stream in, so writing takes constant memory whatever the pack size. The
+reader memory maps the file and only touches the records it is asked
+for.
+
+    $ python puzzle_pack.py write -n 10000 -W 8 -H 8 -o expert.rxp
+    $ python puzzle_pack.py write -n 10000 --ndjson -o pack.ndjson.gz
+    $ python puzzle_pack.py read expert.rxp 0 42
+"""
+from __future__ import print_function
+
+import os
+import sys
+import gzip
+import json
+import mmap
+import zlib
+import random
+import struct
+import argparse
+import tempfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from batch import generate_batch
+from corpus import CORPORA, AVAILABLE_CORPORA
+from difficulty import in_band, puzzle_score
+
+
+MAGIC = b"RXPK"
+END_MAGIC = b"RXPKEND\0"
+VERSION = 2
+HEADER = struct.Struct("<4sBBxx")
+FOOTER = struct.Struct("<QQ8s")
+LENGTH = struct.Struct("<I")
+OFFSET = struct.Struct("<Q")
+
+CODECS = {"none": 0, "zlib": 1, "zstd": 2}
+
+
+def _compressor(codec, level=None):
+    if codec == "none":
+        return lambda data: data
+    if codec == "zlib":
+        return lambda data: zlib.compress(data, level or 6)
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd needs the zstandard package")
+        return zstandard.ZstdCompressor(level=level or 3).compress
+    raise ValueError("Unknown codec {}".format(codec))
+
+
+def _decompressor(codec):
+    if codec == "none":
+        return lambda data: data
+    if codec == "zlib":
+        return zlib.decompress
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd needs the zstandard package")
+        return lambda data: zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError("Unknown codec {}".format(codec))
+
+
+def encode_puzzle(puzzle):
+    """
+    A puzzle dict as lines: id, width, height, score, then the rows,
+    cols, rows2 and cols2 clues and the solution rows if there is one.
+    Clues never contain newlines, and unlike json nothing needs escaping.
+    """
+    score = puzzle.get("score")
+    lines = [puzzle.get("id") or "", str(puzzle["width"]),
+             str(puzzle["height"]), "" if score is None else repr(score)]
+    for key in ("rows", "cols", "rows2", "cols2"):
+        lines.extend(puzzle[key])
+    lines.extend(puzzle.get("solution", ()))
+    return "\n".join(lines).encode("utf-8")
+
+
+def decode_puzzle(data):
+    lines = data.decode("utf-8").split("\n")
+    w, h = int(lines[1]), int(lines[2])
+    puzzle = {"id": lines[0] or None, "width": w, "height": h,
+              "score": float(lines[3]) if lines[3] else None}
+    i = 4
+    for key, n in (("rows", h), ("cols", w), ("rows2", h), ("cols2", w)):
+        puzzle[key] = lines[i:i + n]
+        i += n
+    if len(lines) > i:
+        puzzle["solution"] = lines[i:i + h]
+    return puzzle
+
+
+class PackWriter(object):
+    """
+    Streams puzzles (dicts like to_dict(solution=True)) into a pack file,
+    scoring the ones without a score.
+    """
+
+    def __init__(self, f, codec="zlib", level=None):
+        self._f = f
+        self._compress = _compressor(codec, level)
+        self._offsets = tempfile.TemporaryFile()
+        self._offset = HEADER.size
+        self.count = 0
+        f.write(HEADER.pack(MAGIC, VERSION, CODECS[codec]))
+
+    def write(self, puzzle):
+        if puzzle.get("score") is None:
+            puzzle = dict(puzzle, score=puzzle_score(puzzle))
+        data = self._compress(encode_puzzle(puzzle))
+        self._f.write(LENGTH.pack(len(data)))
+        self._f.write(data)
+        self._offsets.write(OFFSET.pack(self._offset))
+        self._offset += LENGTH.size + len(data)
+        self.count += 1
+
+    def close(self):
+        """
+        Append the index and footer. The file itself is left open.
+        """
+        self._offsets.seek(0)
+        while True:
+            chunk = self._offsets.read(1 << 16)
+            if not chunk:
+                break
+            self._f.write(chunk)
+        self._offsets.close()
+        self._f.write(FOOTER.pack(self._offset, self.count, END_MAGIC))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # No footer after an error, so the partial file does not read as
+        # a complete pack.
+        if exc_type is None:
+            self.close()
+        else:
+            self._offsets.close()
+
+
+def write_pack(path, puzzles, codec="zlib", level=None):
+    """
+    Write puzzles to a new pack file. Returns how many were written. The
+    pack is written to path + ".tmp" and only renamed to path once
+    complete, so an error leaves any existing file as it was.
+    """
+    tmp = path + ".tmp"
+    f = open(tmp, "wb")
+    try:
+        with f:
+            with PackWriter(f, codec, level) as writer:
+                for puzzle in puzzles:
+                    writer.write(puzzle)
+        os.rename(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return writer.count
+
+
+class PuzzlePack(object):
+    """
+    Random access to the puzzles in a pack file. The file is memory mapped
+    and records are decoded on demand, so opening a pack costs the same
+    whatever its size. Safe to share between threads.
+    """
+
+    # Puzzles random() draws looking for one within a score range. Packs
+    # are not indexed by score, so a pack should hold puzzles of about
+    # the scores it is served for.
+    RANDOM_TRIES = 16
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            # mmap cannot map an empty file, so check the size first.
+            if os.fstat(f.fileno()).st_size < HEADER.size + FOOTER.size:
+                raise ValueError("{} is not a puzzle pack".format(path))
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, codec = HEADER.unpack_from(self._map, 0)
+        index, count, end = FOOTER.unpack_from(
+            self._map, len(self._map) - FOOTER.size)
+        codecs = dict((v, k) for k, v in CODECS.items())
+        if (magic != MAGIC or end != END_MAGIC or version != VERSION or
+                codec not in codecs):
+            self._map.close()
+            raise ValueError("{} is not a puzzle pack".format(path))
+        self.codec = codecs[codec]
+        self._decompress = _decompressor(self.codec)
+        self._index = index
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("pack index out of range")
+        offset, = OFFSET.unpack_from(self._map,
+                                     self._index + i * OFFSET.size)
+        length, = LENGTH.unpack_from(self._map, offset)
+        start = offset + LENGTH.size
+        return decode_puzzle(
+            self._decompress(self._map[start:start + length]))
+
+    def __iter__(self):
+        for i in xrange(self._count):
+            yield self[i]
+
+    def random(self, rng=random, min_score=None, max_score=None):
+        """
+        A random puzzle from the pack, or None if it is empty. With a
+        min_score or max_score, a random puzzle scoring within them out
+        of up to RANDOM_TRIES draws, or None if none of them does.
+        """
+        if not self._count:
+            return None
+        if min_score is None and max_score is None:
+            return self[rng.randrange(self._count)]
+        for i in xrange(self.RANDOM_TRIES):
+            puzzle = self[rng.randrange(self._count)]
+            score = puzzle["score"]
+            if score is not None and in_band(score, min_score, max_score):
+                return puzzle
+        return None
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _open_ndjson(path, codec):
+    """
+    A file to write newline delimited json to, compressed as a whole
+    stream with codec.
+    """
+    if path == "-":
+        if codec != "none":
+            raise ValueError("Compressed output needs a file")
+        return sys.stdout
+    if codec == "zlib":
+        return gzip.open(path, "wb")
+    f = open(path, "wb")
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd needs the zstandard package")
+        return zstandard.ZstdCompressor().stream_writer(f)
+    return f
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command")
+
+    write = commands.add_parser(
+        "write", help="Generate puzzles (or read them as newline delimited "
+                      "json) into a pack.")
+    write.add_argument("-o", "--output", required=True)
+    write.add_argument("-i", "--input", type=argparse.FileType("r"),
+                       help="Pack these puzzles instead of generating.")
+    write.add_argument("--codec", choices=sorted(CODECS), default="zlib")
+    write.add_argument("--level", type=int, help="Compression level.")
+    write.add_argument("--ndjson", action="store_true",
+                       help="Write newline delimited json, compressed as a "
+                            "whole (zlib gives gzip).")
+    write.add_argument("-n", "--count", type=int, default=1000)
+    write.add_argument("-W", "--width", type=int, default=8)
+    write.add_argument("-H", "--height", type=int, default=8)
+    write.add_argument("--corpus", choices=sorted(AVAILABLE_CORPORA),
+                       help="Use real words from this corpus.")
+    write.add_argument("--seed", type=int)
+    write.add_argument("--unique", action="store_true")
+    write.add_argument("-j", "--processes", type=int,
+                       help="Worker processes (default: one per core).")
+
+    read = commands.add_parser(
+        "read", help="Print puzzles from a pack as newline delimited json.")
+    read.add_argument("pack")
+    read.add_argument("indexes", nargs="*", type=int,
+                      help="Puzzles to print (default: all).")
+
+    info = commands.add_parser("info", help="Describe a pack.")
+    info.add_argument("pack")
+    args = parser.parse_args(argv)
+    if getattr(args, "codec", None) == "zstd" and zstandard is None:
+        parser.error("zstd needs the zstandard package")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "write":
+        if args.input:
+            puzzles = (json.loads(line) for line in args.input
+                       if line.strip())
+        else:
+            puzzles = generate_batch(
+                args.count, args.width, args.height,
+                use_real_words=bool(args.corpus),
+                textfile=CORPORA.get(args.corpus, "texts/words.txt"),
+                seed=args.seed, processes=args.processes,
+                unique=args.unique)
+        if args.ndjson:
+            f = _open_ndjson(args.output, args.codec)
+            n = 0
+            for puzzle in puzzles:
+                f.write((json.dumps(puzzle, separators=(",", ":")) +
+                         "\n").encode("utf-8"))
+                n += 1
+            if f is not sys.stdout:
+                f.close()
+        else:
+            n = write_pack(args.output, puzzles, args.codec, args.level)
+        print("Wrote {} puzzles".format(n), file=sys.stderr)
+    elif args.command == "read":
+        with PuzzlePack(args.pack) as pack:
+            for i in args.indexes or xrange(len(pack)):
+                print(json.dumps(pack[i], separators=(",", ":")))
+    else:
+        with PuzzlePack(args.pack) as pack:
+            print("{} puzzles, {} codec".format(len(pack), pack.codec))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Pools of ready made puzzles so requests do not have to wait on the
+generator. Each kind of puzzle (route, difficulty, size, ...) gets its own
+pool that background workers keep topped up.
+"""
+from __future__ import print_function
+
+import time
+import threading
+import traceback
+from collections import deque
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class _Pool(object):
+    """
+    The puzzles and counters for a single key.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.puzzles = deque()
+        self.refilling = False
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.errors = 0
+        # Refills in a row that failed, and until when the pool is not
+        # refilled because of them.
+        self.failures = 0
+        self.paused_until = 0
+
+
+class PuzzlePool(object):
+    """
+    Keyed pools of pre-generated puzzles.
+
+    When a pool drops below the low watermark it is scheduled for refill
+    and a background worker generates puzzles until it reaches the high
+    watermark. A request that finds its pool empty generates a puzzle
+    itself and counts as a miss.
+
+    A pool whose factory failed max_failures refills in a row, e.g.
+    because a corpus file is missing, is not refilled for backoff
+    seconds, doubling with every further failure up to MAX_BACKOFF; its
+    requests keep generating for themselves meanwhile. A refill that
+    succeeds resets the count.
+    """
+
+    MAX_BACKOFF = 3600
+
+    def __init__(self, low_watermark=5, high_watermark=20, workers=2,
+                 max_failures=3, backoff=60):
+        assert 0 <= low_watermark <= high_watermark
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.max_failures = max_failures
+        self.backoff = backoff
+        self._num_workers = workers
+        self._pools = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._workers = []
+
+    def get(self, key, factory, generate=None):
+        """
+        Pop a puzzle for the key, generating one with factory() if the
+        pool is empty, or with generate() if given, e.g. to generate within
+        the time the request has. The factory is remembered for refilling
+        the pool.
+        """
+        pool = self._pool(key, factory)
+        try:
+            puzzle = pool.puzzles.popleft()
+        except IndexError:
+            puzzle = None
+        with self._lock:
+            if puzzle is None:
+                pool.misses += 1
+            else:
+                pool.hits += 1
+        if len(pool.puzzles) < self.low_watermark:
+            self._schedule(key, pool)
+        if puzzle is None:
+            puzzle = (generate or factory)()
+        return puzzle
+
+    def stats(self):
+        """
+        Hit, miss and size counters for every pool.
+        """
+        now = time.time()
+        with self._lock:
+            pools = list(self._pools.items())
+        return dict(
+            (key, {
+                "size": len(pool.puzzles),
+                "hits": pool.hits,
+                "misses": pool.misses,
+                "generated": pool.generated,
+                "errors": pool.errors,
+                "paused": pool.paused_until > now,
+            })
+            for key, pool in pools
+        )
+
+    def _pool(self, key, factory):
+        pool = self._pools.get(key)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.setdefault(key, _Pool(factory))
+        return pool
+
+    def _schedule(self, key, pool):
+        if not self.high_watermark or pool.paused_until > time.time():
+            return
+        with self._lock:
+            if pool.refilling:
+                return
+            pool.refilling = True
+            if not self._workers:
+                self._start_workers()
+        self._queue.put(key)
+
+    def _start_workers(self):
+        for i in xrange(self._num_workers):
+            worker = threading.Thread(
+                target=self._work, name="puzzle-pool-{}".format(i))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def _work(self):
+        while True:
+            self._refill(self._queue.get())
+
+    def _refill(self, key):
+        pool = self._pools[key]
+        try:
+            while len(pool.puzzles) < self.high_watermark:
+                pool.puzzles.append(pool.factory())
+                pool.generated += 1
+                pool.failures = 0
+        except Exception:
+            pool.errors += 1
+            pool.failures += 1
+            if pool.failures >= self.max_failures:
+                pause = self.backoff * 2 ** (pool.failures - self.max_failures)
+                pool.paused_until = time.time() + min(pause, self.MAX_BACKOFF)
+            traceback.print_exc()
+        finally:
+            pool.refilling = False
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Keep generated puzzles in a local SQLite database.
+
+Puzzles are stored as the json of to_dict(solution=True) next to the
+columns they are looked up by, including the difficulty score, which is
+worked out when a puzzle is added if it does not have one. Every puzzle
+gets a random key when it is added, so a random puzzle matching a query
+is one index seek on that key instead of a scan of every match.
+
+    $ python puzzle_store.py puzzles.db generate -n 10000 -W 8 -H 8
+    $ python puzzle_store.py puzzles.db import pack.ndjson
+    $ python puzzle_store.py puzzles.db export --corpus words > words.ndjson
+"""
+from __future__ import print_function
+
+import sys
+import json
+import random
+import sqlite3
+import argparse
+import threading
+from itertools import islice
+
+import difficulty
+from batch import generate_batch
+from corpus import CORPORA, AVAILABLE_CORPORA
+from regex_generator import PUZZLE_ID_RE
+
+
+# Difficulty name: (min size, max size, real words, score band). The
+# puzzle routes use the same table and aim for puzzles whose score (see
+# difficulty.py) is within the band; None leaves that end open. Stored
+# puzzles are filed under a difficulty only if their score is in its
+# band.
+DIFFICULTIES = {
+    "beginner": (2, 4, True, (None, 12)),
+    "intermediate": (5, 7, True, (15, 45)),
+    "expert": (8, 10, True, (40, None)),
+    # If you're wondering why I set the limit to 10,
+    # this is the number of columns I could fit on my
+    # phone screen before I had to scroll to see the
+    # last column.
+    "random": (2, 10, False, None),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS puzzles (
+    id INTEGER PRIMARY KEY,
+    puzzle_id TEXT UNIQUE,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    corpus TEXT,
+    difficulty TEXT,
+    rand INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    score REAL
+);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS puzzles_size
+    ON puzzles (corpus, width, height, rand);
+CREATE INDEX IF NOT EXISTS puzzles_difficulty
+    ON puzzles (difficulty, corpus, rand);
+CREATE INDEX IF NOT EXISTS puzzles_corpus ON puzzles (corpus, rand);
+CREATE INDEX IF NOT EXISTS puzzles_rand ON puzzles (rand);
+CREATE INDEX IF NOT EXISTS puzzles_score ON puzzles (corpus, score);
+"""
+
+INSERT = """
+INSERT OR IGNORE INTO puzzles
+    (puzzle_id, width, height, corpus, difficulty, rand, data, score)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def puzzle_corpus(puzzle_id):
+    """
+    The corpus name in a puzzle id ("random" for random characters), or
+    None.
+    """
+    m = PUZZLE_ID_RE.match(puzzle_id or "")
+    return m.group(3) if m else None
+
+
+def difficulty_of(width, height, corpus, score):
+    """
+    The difficulty a puzzle of this size, corpus and score would be served
+    as, or None if it does not fit any.
+    """
+    for name, (low, high, real_words, band) in DIFFICULTIES.items():
+        if (real_words == (corpus != "random") and
+                low <= width <= high and low <= height <= high and
+                difficulty.in_band(score, *(band or ()))):
+            return name
+    return None
+
+
+def _where(width=None, height=None, corpus=None, difficulty=None,
+           min_size=None, max_size=None, min_score=None, max_score=None):
+    """
+    The WHERE clause and parameters for a query. Dimensions that are not
+    given can be bounded by min_size and max_size, and the score by
+    min_score and max_score.
+    """
+    terms = []
+    params = []
+    for op, value in ((">=", min_score), ("<=", max_score)):
+        if value is not None:
+            terms.append("score {} ?".format(op))
+            params.append(value)
+    for column, value in (("corpus", corpus), ("difficulty", difficulty),
+                          ("width", width), ("height", height)):
+        if value is not None:
+            terms.append("{} = ?".format(column))
+            params.append(value)
+    for column, value in (("width", width), ("height", height)):
+        if value is None and min_size is not None:
+            terms.append("{} >= ?".format(column))
+            params.append(min_size)
+        if value is None and max_size is not None:
+            terms.append("{} <= ?".format(column))
+            params.append(max_size)
+    return " AND ".join(terms) or "1", params
+
+
+class PuzzleStore(object):
+    """
+    A SQLite file of puzzles. Each thread gets its own connection, so one
+    store can be shared by every request. Use a file path; every
+    connection to ":memory:" would see a different database.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        self._add_scores(conn)
+        conn.executescript(INDEXES)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _add_scores(self, conn):
+        """
+        Add the score column to a store made before it had one, scoring
+        every puzzle and filing it under the difficulty its score fits.
+        """
+        columns = [row[1] for row in
+                   conn.execute("PRAGMA table_info(puzzles)")]
+        if "score" in columns:
+            return
+        with conn:
+            conn.execute("ALTER TABLE puzzles ADD COLUMN score REAL")
+            rows = conn.execute(
+                "SELECT id, corpus, data FROM puzzles").fetchall()
+            for key, corpus, data in rows:
+                puzzle = json.loads(data)
+                score = puzzle["score"] = difficulty.puzzle_score(puzzle)
+                conn.execute(
+                    "UPDATE puzzles SET score = ?, difficulty = ?, data = ? "
+                    "WHERE id = ?",
+                    (score, difficulty_of(puzzle["width"], puzzle["height"],
+                                          corpus, score),
+                     json.dumps(puzzle, separators=(",", ":")), key))
+
+    def _row(self, puzzle):
+        puzzle_id = puzzle.get("id")
+        corpus = puzzle_corpus(puzzle_id)
+        score = difficulty.puzzle_score(puzzle)
+        if puzzle.get("score") is None:
+            puzzle = dict(puzzle, score=score)
+        return (puzzle_id, puzzle["width"], puzzle["height"], corpus,
+                difficulty_of(puzzle["width"], puzzle["height"], corpus,
+                              score),
+                random.getrandbits(62),
+                json.dumps(puzzle, separators=(",", ":")), score)
+
+    def add(self, puzzle):
+        return self.add_many([puzzle])
+
+    def add_many(self, puzzles, chunksize=1000):
+        """
+        Store puzzles, given as dicts like to_dict(solution=True), in one
+        transaction. Puzzles whose id is already stored are skipped.
+        Returns how many were added.
+        """
+        conn = self._connection()
+        rows = (self._row(puzzle) for puzzle in puzzles)
+        added = 0
+        with conn:
+            while True:
+                chunk = list(islice(rows, chunksize))
+                if not chunk:
+                    break
+                before = conn.total_changes
+                conn.executemany(INSERT, chunk)
+                added += conn.total_changes - before
+        return added
+
+    def get(self, puzzle_id):
+        """
+        The stored puzzle with this id, or None.
+        """
+        row = self._connection().execute(
+            "SELECT data FROM puzzles WHERE puzzle_id = ?",
+            (puzzle_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def random(self, **query):
+        """
+        A random stored puzzle matching the query (see count), or None.
+        Seeks to a random key and takes the next puzzle, wrapping around
+        to the first one.
+        """
+        where, params = _where(**query)
+        key = random.getrandbits(62)
+        conn = self._connection()
+        for op in (">=", "<"):
+            row = conn.execute(
+                "SELECT data FROM puzzles WHERE {} AND rand {} ? "
+                "ORDER BY rand LIMIT 1".format(where, op),
+                params + [key]).fetchone()
+            if row:
+                return json.loads(row[0])
+        return None
+
+    def count(self, **query):
+        """
+        How many puzzles match a query. Takes width, height, corpus,
+        difficulty, min_size and max_size for any dimension that is not
+        given, and min_score and max_score.
+        """
+        where, params = _where(**query)
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM puzzles WHERE " + where,
+            params).fetchone()[0]
+
+    def puzzles(self, **query):
+        """
+        Yield every puzzle matching a query (see count) in insertion
+        order.
+        """
+        where, params = _where(**query)
+        cursor = self._connection().execute(
+            "SELECT data FROM puzzles WHERE {} ORDER BY id".format(where),
+            params)
+        for row in cursor:
+            yield json.loads(row[0])
+
+    def import_ndjson(self, f):
+        """
+        Add the puzzles in a newline delimited json file, like the output
+        of batch.py. Returns how many were added.
+        """
+        return self.add_many(json.loads(line) for line in f if line.strip())
+
+    def export_ndjson(self, f, **query):
+        """
+        Write the puzzles matching a query as newline delimited json.
+        Returns how many were written.
+        """
+        n = 0
+        for puzzle in self.puzzles(**query):
+            f.write(json.dumps(puzzle, separators=(",", ":")) + "\n")
+            n += 1
+        return n
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("db", help="SQLite database file.")
+    commands = parser.add_subparsers(dest="command")
+
+    generate = commands.add_parser(
+        "generate", help="Generate puzzles straight into the store.")
+    generate.add_argument("-n", "--count", type=int, default=1000)
+    generate.add_argument("-W", "--width", type=int, default=8)
+    generate.add_argument("-H", "--height", type=int, default=8)
+    generate.add_argument("--corpus", choices=sorted(AVAILABLE_CORPORA),
+                          help="Use real words from this corpus.")
+    generate.add_argument("--seed", type=int)
+    generate.add_argument("-j", "--processes", type=int,
+                          help="Worker processes (default: one per core).")
+
+    imports = commands.add_parser(
+        "import", help="Add puzzles from newline delimited json files.")
+    imports.add_argument("files", nargs="+", type=argparse.FileType("r"))
+
+    for name in ("export", "count"):
+        command = commands.add_parser(name, help={
+            "export": "Write puzzles as newline delimited json.",
+            "count": "Count puzzles."}[name])
+        command.add_argument("-W", "--width", type=int)
+        command.add_argument("-H", "--height", type=int)
+        command.add_argument("--corpus",
+                             choices=sorted(CORPORA) + ["random"])
+        command.add_argument("--difficulty", choices=sorted(DIFFICULTIES))
+        command.add_argument("--min-score", type=float)
+        command.add_argument("--max-score", type=float)
+        if name == "export":
+            command.add_argument("-o", "--output",
+                                 type=argparse.FileType("w"),
+                                 default=sys.stdout)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    store = PuzzleStore(args.db)
+    if args.command == "generate":
+        added = store.add_many(generate_batch(
+            args.count, args.width, args.height,
+            use_real_words=bool(args.corpus),
+            textfile=CORPORA.get(args.corpus, "texts/words.txt"),
+            seed=args.seed, processes=args.processes, ordered=False))
+        print("Added {} puzzles".format(added), file=sys.stderr)
+    elif args.command == "import":
+        for f in args.files:
+            added = store.import_ndjson(f)
+            print("Added {} puzzles from {}".format(added, f.name),
+                  file=sys.stderr)
+    else:
+        query = dict(width=args.width, height=args.height,
+                     corpus=args.corpus, difficulty=args.difficulty,
+                     min_score=args.min_score, max_score=args.max_score)
+        if args.command == "export":
+            store.export_ndjson(args.output, **query)
+        else:
+            print(store.count(**query))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
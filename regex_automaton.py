@@ -0,0 +1,517 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Compile the regex subset the generator produces into automata over
+ALLOWED_CHARACTERS.
+
+Character classes, negated classes, ?, *, +, {n}, alternation groups and
+backreferences to single character groups like (.) are supported. The
+automaton answers which characters can appear at each position of a match
+of a given length in one forward and one backward pass, and matches whole
+strings without backtracking. Automata are cached per pattern.
+"""
+from __future__ import print_function
+
+import re
+
+from lru_cache import LRUCache
+
+
+ALLOWED_CHARACTERS = ("ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+                      "1234567890")
+ALL = (1 << len(ALLOWED_CHARACTERS)) - 1
+BITS = dict((c, 1 << i) for i, c in enumerate(ALLOWED_CHARACTERS))
+
+
+def popcount(mask):
+    return bin(mask).count("1")
+
+
+def chars(mask):
+    """
+    The characters in a mask.
+    """
+    return [c for c in ALLOWED_CHARACTERS if mask & BITS[c]]
+
+
+##########################################
+# PARSING
+##########################################
+
+class _Parser(object):
+    """
+    Parses the regex subset the generator produces into a tree of tuples:
+    ("set", mask), ("cat", [nodes]), ("alt", [nodes]),
+    ("rep", node, min, max or None), ("group", node, index) and
+    ("ref", index) for backreferences.
+    """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.pos = 0
+        self.groups = 0
+
+    def parse(self):
+        node = self._alt()
+        if self.pos != len(self.pattern):
+            raise ValueError("Unsupported pattern {}".format(self.pattern))
+        return node
+
+    def _peek(self):
+        if self.pos < len(self.pattern):
+            return self.pattern[self.pos]
+        return None
+
+    def _next(self):
+        c = self._peek()
+        self.pos += 1
+        return c
+
+    def _alt(self):
+        branches = [self._cat()]
+        while self._peek() == "|":
+            self.pos += 1
+            branches.append(self._cat())
+        return branches[0] if len(branches) == 1 else ("alt", branches)
+
+    def _cat(self):
+        items = []
+        while self._peek() not in (None, "|", ")"):
+            items.append(self._repeat(self._atom()))
+        return ("cat", items)
+
+    def _atom(self):
+        c = self._next()
+        if c == "(":
+            self.groups += 1
+            index = self.groups
+            node = self._alt()
+            if self._next() != ")":
+                raise ValueError("Unbalanced pattern {}".format(self.pattern))
+            return ("group", node, index)
+        elif c == "[":
+            return self._class()
+        elif c == ".":
+            return ("set", ALL)
+        elif c == "\\":
+            c = self._next()
+            if c is None or not c.isdigit():
+                raise ValueError("Unsupported escape in {}"
+                                 .format(self.pattern))
+            return ("ref", int(c))
+        elif c in BITS:
+            return ("set", BITS[c])
+        raise ValueError("Unsupported pattern {}".format(self.pattern))
+
+    def _class(self):
+        negate = self._peek() == "^"
+        if negate:
+            self.pos += 1
+        mask = 0
+        while self._peek() not in (None, "]"):
+            mask |= BITS.get(self._next(), 0)
+        if self._next() != "]":
+            raise ValueError("Unbalanced pattern {}".format(self.pattern))
+        return ("set", ALL & ~mask if negate else mask)
+
+    def _repeat(self, node):
+        c = self._peek()
+        if c == "?":
+            self.pos += 1
+            return ("rep", node, 0, 1)
+        elif c == "*":
+            self.pos += 1
+            return ("rep", node, 0, None)
+        elif c == "+":
+            self.pos += 1
+            return ("rep", node, 1, None)
+        elif c == "{":
+            end = self.pattern.index("}", self.pos)
+            n = int(self.pattern[self.pos + 1:end])
+            self.pos = end + 1
+            return ("rep", node, n, n)
+        return node
+
+
+def parse(pattern):
+    """
+    The parse tree of a pattern, see _Parser.
+    """
+    return _Parser(pattern).parse()
+
+
+##########################################
+# AUTOMATA
+##########################################
+
+def _single_set(node):
+    """
+    The mask of a node that always matches exactly one character from a
+    set, or None.
+    """
+    if node[0] == "set":
+        return node[1]
+    elif node[0] == "group" or (node[0] == "cat" and len(node[1]) == 1):
+        return _single_set(node[1] if node[0] == "group" else node[1][0])
+    return None
+
+
+class _Builder(object):
+    """
+    Thompson construction of an NFA with epsilon moves.
+
+    Character moves are (mask, target, group, ref): a move inside a single
+    character group records the character as that group's capture, and a
+    backreference move may only take the character its group captured.
+    Groups wider than one character are not captured; their indices are
+    kept in wide_groups.
+    """
+
+    def __init__(self):
+        self.eps = []
+        self.moves = []
+        self.wide_groups = set()
+
+    def state(self):
+        self.eps.append([])
+        self.moves.append([])
+        return len(self.eps) - 1
+
+    def build(self, node, start, end):
+        kind = node[0]
+        if kind == "set":
+            self.moves[start].append((node[1], end, 0, 0))
+        elif kind == "ref":
+            self.moves[start].append((ALL, end, 0, node[1]))
+        elif kind == "group":
+            mask = _single_set(node[1])
+            if mask is None:
+                self.wide_groups.add(node[2])
+                self.build(node[1], start, end)
+            else:
+                self.moves[start].append((mask, end, node[2], 0))
+        elif kind == "cat":
+            cur = start
+            for item in node[1]:
+                nxt = self.state()
+                self.build(item, cur, nxt)
+                cur = nxt
+            self.eps[cur].append(end)
+        elif kind == "alt":
+            for branch in node[1]:
+                self.build(branch, start, end)
+        elif kind == "rep":
+            _, item, low, high = node
+            cur = start
+            for i in xrange(low):
+                nxt = self.state()
+                self.build(item, cur, nxt)
+                cur = nxt
+            if high is None:
+                loop = self.state()
+                self.eps[cur].append(loop)
+                body = self.state()
+                self.build(item, loop, body)
+                self.eps[body].append(loop)
+                self.eps[loop].append(end)
+            else:
+                for i in xrange(high - low):
+                    nxt = self.state()
+                    self.build(item, cur, nxt)
+                    self.eps[cur].append(end)
+                    cur = nxt
+                self.eps[cur].append(end)
+
+
+def width(node):
+    """
+    The (min, max) number of characters a node matches, max being None
+    when unbounded. Backreferences are assumed to match one character
+    like the (.) groups they refer to.
+    """
+    kind = node[0]
+    if kind in ("set", "ref"):
+        return 1, 1
+    elif kind == "group":
+        return width(node[1])
+    elif kind == "rep":
+        low, high = width(node[1])
+        if node[3] is None or high is None:
+            return low * node[2], None
+        return low * node[2], high * node[3]
+    widths = map(width, node[1])
+    if kind == "alt":
+        highs = [w[1] for w in widths]
+        return (min(w[0] for w in widths),
+                None if None in highs else max(highs))
+    highs = [w[1] for w in widths]
+    return (sum(w[0] for w in widths),
+            None if None in highs else sum(highs))
+
+
+class Automaton(object):
+    """
+    An epsilon free NFA for a clue.
+
+    States are numbered from 0, the start state. moves[s] lists the
+    (successor, mask) pairs of state s, mask being the characters that
+    lead there, and accepting holds the states the clue can end in.
+
+    moves treats backreferences as any character, which is what filter()
+    and positions() work with. matches() follows captures exactly, unless
+    exact is False because a backreference refers to a wider group.
+    """
+
+    # Number of filter() results remembered per automaton. The search
+    # keeps filtering the same lines with the same masks.
+    MEMO_SIZE = 512
+
+    def __init__(self, pattern):
+        builder = _Builder()
+        start = builder.state()
+        end = builder.state()
+        self.pattern = pattern
+        self._tree = parse(pattern)
+        self._equalities = {}
+        self._positions = {}
+        builder.build(self._tree, start, end)
+        refs = set(move[3] for moves in builder.moves for move in moves)
+        self.has_backrefs = any(refs)
+        self.exact = not (refs & builder.wide_groups)
+
+        ids = {start: 0}
+        order = [start]
+        self.start = 0
+        self.moves = []
+        # Only matches() needs the group and ref of each move, and only
+        # with backreferences to follow.
+        self._tagged = [] if self.has_backrefs else None
+        self._bit_moves = []
+        accepting = set()
+        eps = builder.eps
+        for s in order:
+            # Most states have no epsilon moves of their own.
+            closure = self._closure(eps, s) if eps[s] else (s,)
+            tagged = [move for u in closure for move in builder.moves[u]]
+            moves = {}
+            for mask, t, group, ref in tagged:
+                if t in moves:
+                    moves[t] |= mask
+                else:
+                    moves[t] = mask
+                    if t not in ids:
+                        ids[t] = len(order)
+                        order.append(t)
+            moves = [(ids[t], mask) for t, mask in moves.iteritems()]
+            self.moves.append(tuple(moves))
+            self._bit_moves.append(tuple([(1 << t, mask)
+                                          for t, mask in moves]))
+            if self._tagged is not None:
+                self._tagged.append(tuple([(ids[t], mask, group, ref)
+                                           for mask, t, group, ref in tagged]))
+            if end in closure:
+                accepting.add(ids[s])
+        self.accepting = frozenset(accepting)
+        self._states = [(s, 1 << s) for s in xrange(len(self.moves))]
+        self._accepting_bits = sum(1 << s for s in accepting)
+        self._memo = {}
+
+    @staticmethod
+    def _closure(eps, s):
+        seen = set([s])
+        todo = [s]
+        while todo:
+            for t in eps[todo.pop()]:
+                if t not in seen:
+                    seen.add(t)
+                    todo.append(t)
+        return seen
+
+    def equalities(self, length):
+        """
+        Pairs of positions that a backreference forces to be equal in
+        every match of the given length. Only backreferences in the top
+        level of the pattern whose position is fixed are found.
+        """
+        pairs = self._equalities.get(length)
+        if pairs is not None:
+            return pairs
+        pairs = []
+        if self._tree[0] == "cat":
+            items = self._tree[1]
+            widths = map(width, items)
+            groups = {}
+            low = high = 0
+            total_low = sum(w[0] for w in widths)
+            for item, (w_low, w_high) in zip(items, widths):
+                # Everything after this item must fit in what is left.
+                latest = length - (total_low - low)
+                if (item[0] in ("group", "ref") and w_low == w_high == 1
+                        and (low == high or low == latest)):
+                    if item[0] == "group":
+                        groups[item[2]] = low
+                    elif item[1] in groups:
+                        pairs.append((groups[item[1]], low))
+                low += w_low
+                if high is not None and w_high is not None:
+                    high += w_high
+                else:
+                    high = None
+        self._equalities[length] = pairs
+        return pairs
+
+    def positions(self, length):
+        """
+        For a match of the given length, the mask of characters that can
+        appear at each position, or None if nothing of that length
+        matches. Backreferences count as any character here.
+        """
+        try:
+            return self._positions[length]
+        except KeyError:
+            result = self._filter([ALL] * length)
+            self._positions[length] = result
+            return result
+
+    def matches(self, string):
+        """
+        Whether the whole string matches, following captures so
+        backreferences are checked exactly. Runs in time linear in the
+        length of the string.
+        """
+        if not self.exact:
+            return full_regex(self.pattern).match(string) is not None
+        if not self.has_backrefs:
+            masks = [BITS.get(c) for c in string]
+            return None not in masks and self._filter(masks) is not None
+        current = set([(self.start, ())])
+        for c in string:
+            bit = BITS.get(c)
+            if bit is None:
+                return False
+            following = set()
+            for s, captures in current:
+                for t, mask, group, ref in self._tagged[s]:
+                    if ref:
+                        if ref > len(captures) or captures[ref - 1] != c:
+                            continue
+                    elif not mask & bit:
+                        continue
+                    if group:
+                        padded = captures + ("",) * (group - len(captures))
+                        following.add(
+                            (t, padded[:group - 1] + (c,) + padded[group:]))
+                    else:
+                        following.add((t, captures))
+            if not following:
+                return False
+            current = following
+        return any(s in self.accepting for s, captures in current)
+
+    def filter(self, domains):
+        """
+        Narrow the masks of a line to the characters that appear in some
+        accepted string that fits the masks. Returns the new masks, or
+        None if no string fits.
+        """
+        key = tuple(domains)
+        try:
+            result = self._memo[key]
+        except KeyError:
+            pass
+        else:
+            return None if result is None else list(result)
+
+        result = self._filter(domains)
+        if len(self._memo) >= self.MEMO_SIZE:
+            self._memo.clear()
+        self._memo[key] = result
+        return None if result is None else list(result)
+
+    def _filter(self, domains):
+        # State sets are kept as bitsets, states being numbered densely.
+        length = len(domains)
+        moves = self._bit_moves
+        states = self._states
+        forward = [1]
+        for k in xrange(length):
+            dom = domains[k]
+            cur = forward[k]
+            layer = 0
+            for s, bit in states:
+                if cur & bit:
+                    for t, mask in moves[s]:
+                        if mask & dom:
+                            layer |= t
+            if not layer:
+                return None
+            forward.append(layer)
+
+        alive = forward[length] & self._accepting_bits
+        if not alive:
+            return None
+        result = [0] * length
+        for k in xrange(length - 1, -1, -1):
+            dom = domains[k]
+            cur = forward[k]
+            prev = 0
+            supported = 0
+            for s, bit in states:
+                if cur & bit:
+                    for t, mask in moves[s]:
+                        if t & alive and mask & dom:
+                            prev |= bit
+                            supported |= mask & dom
+            result[k] = supported
+            alive = prev
+        return tuple(result)
+
+
+_automata = LRUCache(4096)
+_compiled = LRUCache(8192)
+
+
+def automaton(pattern):
+    """
+    The automaton for a pattern, compiled once per process.
+    """
+    a = _automata.get(pattern)
+    if a is None:
+        a = Automaton(pattern)
+        _automata.put(pattern, a)
+    return a
+
+
+def full_regex(pattern):
+    """
+    The pattern compiled so that match() only succeeds on whole strings.
+    Compiled once per process and shared by every thread.
+    """
+    regex = _compiled.get(pattern)
+    if regex is None:
+        regex = re.compile("(?:" + pattern + r")\Z")
+        _compiled.put(pattern, regex)
+    return regex
+
+
+def fullmatch(pattern, string):
+    """
+    Whether the whole string matches the pattern.
+    """
+    return automaton(pattern).matches(string)
+
+
+def positions(pattern, length):
+    """
+    The mask of characters that can appear at each position of a match
+    of the given length, or None. See Automaton.positions.
+    """
+    return automaton(pattern).positions(length)
+
+
+def cache_stats():
+    """
+    Size, hit and miss counters of the automaton and compiled regex
+    caches.
+    """
+    return {"automata": _automata.stats(), "regexes": _compiled.stats()}
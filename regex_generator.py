@@ -5,22 +5,321 @@ from __future__ import print_function
 import sys
 import re
 import random
+import threading
 
-from flask import current_app
+from corpus import load_corpus, corpus_name, CORPORA, AVAILABLE_CORPORA
+from solver import Solver
+from crossword_fill import fill_grid, words_of_length
+import difficulty
+import metrics
+import backtracking
+from regex_automaton import automaton, full_regex, popcount, ALL
+
+
+PUZZLE_ID_RE = re.compile(r"^(\d+)x(\d+)-([a-z]+)-([0-9a-f]+)(-u)?$")
+
+
+def check_grid(grid, rows, cols):
+    """
+    Which rows and cols of a grid fully match all of their clues. grid is
+    a list of row strings, rows[i] and cols[i] are lists of patterns.
+    Returns a list of bools for the rows and one for the cols.
+    """
+    columns = ["".join(col) for col in zip(*grid)]
+    rows_ok = [all(full_regex(p).match(row) for p in clues)
+               for row, clues in zip(grid, rows)]
+    cols_ok = [all(full_regex(p).match(col) for p in clues)
+               for col, clues in zip(columns, cols)]
+    return rows_ok, cols_ok
+
+
+class Clue(object):
+    """
+    A generated clue: its pattern, and the pattern compiled once so that
+    match() only succeeds on whole strings. The generator checks its own
+    puzzles with these rather than through the shared cache of
+    full_regex, which is left to the puzzles being played.
+    """
+
+    __slots__ = ("pattern", "_regex")
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self._regex = re.compile("(?:" + pattern + r")\Z")
+
+    def match(self, string):
+        return self._regex.match(string)
+
+    def __repr__(self):
+        return "Clue({!r})".format(self.pattern)
+
+
+class PatternStrategy(object):
+    """
+    A way of turning a string into a regex that matches it.
+
+    func(generator, string, **kwargs) returns the pattern. The strategy
+    is only offered strings it fully supports: lengths between min_length
+    and max_length (None for no limit), with repeated characters if
+    needs_duplicates is set and at least min_distinct distinct characters.
+    Cheap strategies are the ones used when generation runs short of time.
+    """
+
+    __slots__ = ("name", "func", "min_length", "max_length",
+                 "needs_duplicates", "min_distinct", "cheap")
+
+    def __init__(self, name, func, min_length=2, max_length=None,
+                 needs_duplicates=False, min_distinct=1, cheap=False):
+        self.name = name
+        self.func = func
+        self.min_length = min_length
+        self.max_length = max_length
+        self.needs_duplicates = needs_duplicates
+        self.min_distinct = min_distinct
+        self.cheap = cheap
+
+    def supports(self, length, distinct):
+        return (self.min_length <= length and
+                (self.max_length is None or length <= self.max_length) and
+                (not self.needs_duplicates or distinct < length) and
+                distinct >= self.min_distinct)
+
+    def __repr__(self):
+        return "PatternStrategy({!r})".format(self.name)
+
+
+class PatternRegistry(object):
+    """
+    The pattern strategies the generator picks from.
+
+    The strategies that apply to each (length, distinct characters) pair
+    are worked out once and kept in a table that is rebuilt whenever a
+    strategy is added or removed.
+    """
+
+    def __init__(self):
+        self._strategies = []
+        self._table = {}
+        self._lock = threading.Lock()
+
+    def register(self, func=None, name=None, **options):
+        """
+        Add a strategy. The options are those of PatternStrategy. Can also
+        be used as a decorator.
+        """
+        if func is None:
+            return lambda f: self.register(f, name=name, **options)
+        strategy = PatternStrategy(name or func.__name__, func, **options)
+        with self._lock:
+            self._strategies = [s for s in self._strategies
+                                if s.name != strategy.name] + [strategy]
+            self._table = {}
+        return func
+
+    def unregister(self, name):
+        with self._lock:
+            self._strategies = [s for s in self._strategies
+                                if s.name != name]
+            self._table = {}
+
+    def candidates(self, string, cheap=False):
+        """
+        The strategies that apply to a string, only the cheap ones if
+        asked for and there are any.
+        """
+        key = (len(string), len(set(string)), cheap)
+        table = self._table
+        try:
+            return table[key]
+        except KeyError:
+            pass
+        candidates = tuple(s for s in self._strategies
+                           if s.supports(*key[:2]))
+        if not candidates:
+            raise ValueError("No pattern applies to {}".format(string))
+        if cheap:
+            candidates = tuple(s for s in candidates if s.cheap) or candidates
+        table[key] = candidates
+        return candidates
+
+    def __iter__(self):
+        return iter(self._strategies)
+
+    def __len__(self):
+        return len(self._strategies)
 
 
 class RegexCrosswordGenerator(object):
     """
     Class for generating the regular expressions for a grid.
+
+    All randomness comes from a single random.Random, so a puzzle can be
+    rebuilt exactly from its seed. Pass either an int seed or a
+    random.Random instance as seed; without one a fresh seed is drawn
+    for every reset().
+
+    With unique=True the rows and cols clues are tightened until the
+    puzzle has exactly one solution. A grid that is not unique after
+    TIGHTEN_ROUNDS_PER_CELL rounds per cell is dropped for one from the
+    next seed, up to MAX_UNIQUE_RESTARTS times.
+
+    With a deadline (see deadline.py) the generator degrades instead of
+    running late: it gives up tightening once the deadline has passed
+    (the puzzle is then the same as with unique=False), and skips the
+    word fill and uses only cheap pattern strategies once half the budget
+    is gone. The steps given up are listed in degraded. The last two
+    change the puzzle its seed would give, so it then has no puzzle_id.
     """
 
     ALLOWED_CHARACTERS = ("ABCDEFGHIJKLMNOPQRSTUVWXYZ"
                           "1234567890")
 
+    # Strategies for the clues. Register new ones with
+    # RegexCrosswordGenerator.patterns.register(func, ...).
+    patterns = PatternRegistry()
+
+    # How many clues may be replaced per cell of the grid to make a
+    # puzzle unique, how many candidates are drawn for each replacement,
+    # and how many fresh grids are tried when that is not enough. Most
+    # grids are unique after about one round per cell.
+    TIGHTEN_ROUNDS_PER_CELL = 2
+    TIGHTEN_DRAWS = 4
+    MAX_UNIQUE_RESTARTS = 4
+
+    # Real word grids up to this many cells are filled so that every row
+    # and col is a word. Larger ones rarely have a fill at all, so only
+    # their rows are words.
+    MAX_FILL_AREA = 30
+
+    # Puzzles generated by in_score_band() before settling for the one
+    # scoring closest to the band.
+    MAX_SCORE_TRIES = 4
+
+    # Estimated backtracking steps a clue may take to reject a wrong
+    # answer before it is redrawn (see backtracking.guard).
+    MAX_MATCH_STEPS = backtracking.MAX_STEPS
+
     def __init__(self, width=2, height=2, use_real_words=False,
-                 textfile="texts/words.txt"):
+                 textfile="texts/words.txt", seed=None, unique=False,
+                 deadline=None):
         self.reset(width, height, use_real_words=use_real_words,
-                   textfile=textfile)
+                   textfile=textfile, seed=seed, unique=unique,
+                   deadline=deadline)
+
+    @classmethod
+    def in_score_band(cls, width, height, low=None, high=None, seed=None,
+                      tries=None, deadline=None, **kwargs):
+        """
+        Generate puzzles until one scores between low and high (either
+        can be None), keeping the closest one after MAX_SCORE_TRIES, or
+        once another try would likely run past the deadline.
+        Every try gets its own seed drawn from seed, so the puzzle id of
+        the result rebuilds it like any other.
+        """
+        rng = random.Random(seed)
+        best = None
+        best_distance = None
+        for i in xrange(tries or cls.MAX_SCORE_TRIES):
+            if (best is not None and deadline is not None and
+                    deadline.remaining() < deadline.elapsed() / i):
+                best._degrade("score_band")
+                break
+            metrics.inc("score_band_tries")
+            x = cls(width, height, seed=rng.getrandbits(32),
+                    deadline=deadline, **kwargs)
+            distance = max(0 if low is None else low - x.score,
+                           0 if high is None else x.score - high, 0)
+            if best is None or distance < best_distance:
+                best, best_distance = x, distance
+            if not distance:
+                break
+        else:
+            metrics.inc("score_band_misses")
+        return best
+
+    @classmethod
+    def from_puzzle_id(cls, puzzle_id, deadline=None):
+        """
+        Rebuild the puzzle identified by puzzle_id. With a deadline the
+        result may be degraded, in which case its puzzle_id differs.
+        """
+        m = PUZZLE_ID_RE.match(puzzle_id)
+        if not m or (m.group(3) != "random" and
+                     m.group(3) not in AVAILABLE_CORPORA):
+            raise ValueError("Invalid puzzle id {}".format(puzzle_id))
+        width, height = int(m.group(1)), int(m.group(2))
+        if not (2 <= width <= 12 and 2 <= height <= 12):
+            raise ValueError("Invalid puzzle id {}".format(puzzle_id))
+        corpus = m.group(3)
+        unique = bool(m.group(5))
+        if corpus == "random":
+            return cls(width, height, seed=int(m.group(4), 16),
+                       unique=unique, deadline=deadline)
+        return cls(width, height, use_real_words=True,
+                   textfile=CORPORA[corpus], seed=int(m.group(4), 16),
+                   unique=unique, deadline=deadline)
+
+    @property
+    def seed(self):
+        return self._seed
+
+    @property
+    def puzzle_id(self):
+        """
+        A short string that from_puzzle_id() turns back into this puzzle,
+        or None if the puzzle was not made from an int seed and a known
+        corpus.
+        """
+        if self._seed is None or not self._reproducible:
+            return None
+        if not self._use_real_words:
+            corpus = "random"
+        else:
+            corpus = corpus_name(self._textfile)
+            if corpus is None:
+                return None
+        return "{}x{}-{}-{:x}{}".format(self._w, self._h, corpus, self._seed,
+                                        "-u" if self._tightened else "")
+
+    @property
+    def unique(self):
+        """
+        Whether the rows and cols clues have exactly one solution, or None
+        if that was not checked.
+        """
+        return self._unique
+
+    @property
+    def degraded(self):
+        """
+        The steps cut short to meet the deadline, e.g. ("tighten",).
+        """
+        return tuple(self._degraded)
+
+    @property
+    def filled(self):
+        """
+        Whether every row and col of the solution is a word from the
+        corpus.
+        """
+        return self._filled
+
+    @property
+    def score(self):
+        """
+        How hard the rows and cols clues are, see difficulty.score.
+        Worked out on first use, from the Solver that found a unique
+        puzzle unique if there is one.
+        """
+        if self._score is None:
+            if self._solver is not None:
+                self._score = difficulty.solver_score(self._solver)
+                self._solver = None
+            else:
+                self._score = difficulty.score(
+                    self._w, self._h, [[r] for r in self._rows],
+                    [[c] for c in self._cols])
+        return self._score
 
     @property
     def possible_solution(self):
@@ -42,6 +341,14 @@ class RegexCrosswordGenerator(object):
     def cols2(self):
         return self._cols2
 
+    @property
+    def retries(self):
+        """
+        How many extra draws the last reset() needed to keep clues and
+        alternate strings distinct. Bounded by a small constant per clue.
+        """
+        return self._retries
+
     @property
     def width(self):
         return self._w
@@ -50,42 +357,99 @@ class RegexCrosswordGenerator(object):
     def height(self):
         return self._h
 
+    def to_dict(self, solution=False):
+        """
+        The clues and dimensions of the puzzle as plain data, optionally
+        with the solution the clues were generated from. The score is
+        None unless it has been worked out already, as in_score_band()
+        does; stores and packs score puzzles as they are added.
+        """
+        data = {
+            "id": self.puzzle_id,
+            "width": self._w,
+            "height": self._h,
+            "score": None if self._score is None else round(self._score, 1),
+            "rows": [r.pattern for r in self._rows],
+            "cols": [c.pattern for c in self._cols],
+            "rows2": [r.pattern for r in self._rows2],
+            "cols2": [c.pattern for c in self._cols2],
+        }
+        if solution:
+            data["solution"] = list(self._grid)
+        return data
+
     def reset(self, width, height, use_real_words=False,
-              textfile="texts/words.txt"):
+              textfile="texts/words.txt", seed=None, unique=False,
+              deadline=None, _restarts=0):
         """
         Create a new crossword.
         """
         assert width >= 2 and height >= 2
 
+        if isinstance(seed, random.Random):
+            self._random = seed
+            self._seed = None
+        else:
+            if seed is None:
+                seed = random.getrandbits(32)
+            self._random = random.Random(seed)
+            self._seed = seed
+
         self._w = width
         self._h = height
-        grid = self._generate_grid(
-            width, height, use_real_words=use_real_words, textfile=textfile)
+        self._use_real_words = use_real_words
+        self._textfile = textfile
+        self._retries = 0
+        self._deadline = deadline
+        self._degraded = []
+        self._reproducible = True
+        with metrics.timer("generate_step", step="grid"):
+            grid = self._generate_grid(width, height,
+                                       use_real_words=use_real_words,
+                                       textfile=textfile)
         rows = [""] * height
         cols = [""] * width
         rows2 = [""] * height
         cols2 = [""] * width
-        for i in xrange(height):
-            rows[i] = self._regex_from_string(grid[i])
-            rows2[i] = self._regex_from_string(grid[i])
-            while rows[i] == rows2[i]:
-                rows2[i] = self._regex_from_string(grid[i])
-        for i in xrange(width):
-            col = "".join(map(lambda x: x[i], grid))
-            cols[i] = self._regex_from_string(col)
-            cols2[i] = self._regex_from_string(col)
-            while cols[i] == cols2[i]:
-                cols2[i] = self._regex_from_string(col)
+        with metrics.timer("generate_step", step="clues"):
+            for i in xrange(height):
+                rows[i] = self._regex_from_string(grid[i])
+                rows2[i] = self._distinct_regex(grid[i], rows[i])
+            for i in xrange(width):
+                col = "".join(map(lambda x: x[i], grid))
+                cols[i] = self._regex_from_string(col)
+                cols2[i] = self._distinct_regex(col, cols[i])
+        self._unique = None
+        self._score = None
+        self._solver = None
+        if unique:
+            with metrics.timer("generate_step", step="tighten"):
+                self._unique = self._tighten(grid, rows, cols, rows2, cols2)
+            if self._unique is None:
+                self._degrade("tighten")
+            elif not self._unique and _restarts < self.MAX_UNIQUE_RESTARTS:
+                # Start over from the next seed, which the puzzle id then
+                # names, rather than serve a puzzle that is not unique.
+                metrics.inc("tighten_restarts")
+                if self._seed is not None:
+                    seed = self._random.getrandbits(32)
+                return self.reset(width, height, use_real_words, textfile,
+                                  seed, unique, deadline, _restarts + 1)
+        self._tightened = self._unique is True
         self._rows = rows
         self._cols = cols
         self._rows2 = rows2
         self._cols2 = cols2
         self._grid = grid
 
+        metrics.inc("puzzles_generated")
+        metrics.inc("generator_retries", self._retries)
+
         # Just make sure the regex generated from the grid
         # works with the grid itself.
         try:
-            assert self.validate_solution(grid)
+            with metrics.timer("generate_step", step="validate"):
+                assert self.validate_solution(grid)
         except AssertionError:
             print("\n".join([
                 "The solution:",
@@ -108,83 +472,278 @@ class RegexCrosswordGenerator(object):
         Generate a grid of random characters.
         This will be one of the possible solutions to the
         crossword.
+
+        With real words the grid is filled with words across and down
+        where possible. Failing that every row is a word, and failing
+        that the words are simply run together.
         """
+        self._filled = False
         grid = []
         if use_real_words:
-            with current_app.open_resource(textfile) as f:
-                used_words = set()
-                text = f.read().split()
-                s = ""
-                word = random.choice(text).strip().upper()
-                while len(s) < w * h:
-                    if word.isalnum() and word not in used_words:
-                        s += word
-                        used_words.add(word)
-                    word = random.choice(text).strip().upper()
-                for i in xrange(h):
-                    grid.append(s[:w])
-                    s = s[w:]
+            corpus = load_corpus(textfile)
+            if w * h <= self.MAX_FILL_AREA and not self._hurry("fill"):
+                filled = fill_grid(corpus, w, h, self._random)
+                if filled is not None:
+                    metrics.inc("word_grids", fill="full")
+                    self._filled = True
+                    return filled
+            words = words_of_length(corpus, w)
+            if len(words) >= h:
+                metrics.inc("word_grids", fill="rows")
+                return [words[i] for i in
+                        self._random.sample(xrange(len(words)), h)]
+            metrics.inc("word_grids", fill="joined")
+            words = self._sample_words(corpus)
+            s = ""
+            while len(s) < w * h:
+                s += next(words)
+            for i in xrange(h):
+                grid.append(s[:w])
+                s = s[w:]
         else:
             for i in xrange(h):
-                grid.append("".join(random.sample(self.ALLOWED_CHARACTERS, w)))
+                grid.append("".join(self._random.sample(self.ALLOWED_CHARACTERS, w)))
         return grid
 
+    def _tighten(self, grid, rows, cols, rows2, cols2):
+        """
+        Replace rows and cols clues until the grid is the only solution.
+        Each round finds another solution and swaps a clue of a line where
+        it differs for one that rejects it. Returns whether the puzzle
+        ended up unique, or None if the deadline passed first. Unless it
+        is unique the clues are put back as they were.
+        """
+        w, h = len(grid[0]), len(grid)
+        rounds = self.TIGHTEN_ROUNDS_PER_CELL * w * h
+        original = rows[:], cols[:]
+        # The replacement clues are drawn from every strategy, the clues
+        # are all put back if tightening runs out of time anyway.
+        deadline, self._deadline = self._deadline, None
+        try:
+            for i in xrange(rounds + 1):
+                if deadline is not None and deadline.expired():
+                    rows[:], cols[:] = original
+                    return None
+                solver = Solver(w, h, [[r] for r in rows],
+                                [[c] for c in cols])
+                others = [s for s in solver.solve(2) if s != grid]
+                if not others:
+                    self._solver = solver
+                    return True
+                if i == rounds:
+                    rows[:], cols[:] = original
+                    return False
+                metrics.inc("tighten_rounds")
+                other = others[0]
+                r, c = self._random.choice([
+                    (r, c) for r in xrange(h) for c in xrange(w)
+                    if other[r][c] != grid[r][c]])
+                if self._random.randint(0, 1):
+                    rows[r] = self._rejecting_regex(grid[r], other[r],
+                                                    rows2[r])
+                else:
+                    col = "".join(row[c] for row in grid)
+                    wrong = "".join(row[c] for row in other)
+                    cols[c] = self._rejecting_regex(col, wrong, cols2[c])
+        finally:
+            self._deadline = deadline
+
+    def _rejecting_regex(self, string, wrong, other):
+        """
+        Generate a regex for the string that does not match wrong and is
+        different from other. Out of a few draws the one allowing the
+        fewest characters per position is kept, falling back to
+        _decoy_regex().
+        """
+        best = None
+        best_looseness = None
+        for i in xrange(self.TIGHTEN_DRAWS):
+            regex = self._distinct_regex(string, other)
+            if regex.match(wrong):
+                self._retries += 1
+                continue
+            looseness = sum(map(popcount, automaton(regex.pattern).filter(
+                [ALL] * len(string))))
+            if best is None or looseness < best_looseness:
+                best, best_looseness = regex, looseness
+        if best is not None:
+            return best
+        metrics.inc("pattern_fallbacks", reason="rejecting")
+        return self._decoy_regex(string, wrong, other)
+
+    def _degrade(self, step, reproducible=True):
+        """
+        Record a step cut short to meet the deadline.
+        """
+        if step not in self._degraded:
+            self._degraded.append(step)
+            metrics.inc("degraded", step=step)
+        self._reproducible = self._reproducible and reproducible
+
+    def _hurry(self, step):
+        """
+        Whether to take the cheap way through a step because half the
+        time for this puzzle is gone. That changes the puzzle its seed
+        gives, so it loses its id.
+        """
+        if self._deadline is None or not self._deadline.near():
+            return False
+        self._degrade(step, reproducible=False)
+        return True
+
+    def _sample_words(self, words):
+        """
+        Yield distinct random words from the corpus.
+        This is a lazy Fisher-Yates shuffle, so every draw
+        is a new word without any rejection.
+        """
+        swapped = {}
+        for i in xrange(len(words)):
+            j = self._random.randint(i, len(words) - 1)
+            pick = swapped.get(j, j)
+            swapped[j] = swapped.get(i, i)
+            yield words[pick]
+
     def _alternate_string(self, string):
         """
         Generate a random string that is different
         and the same length as the given string.
         """
         length = len(string)
-        diff_str = "".join(random.sample(self.ALLOWED_CHARACTERS, length))
-        while diff_str == string:
-            diff_str = "".join(random.sample(self.ALLOWED_CHARACTERS, length))
-        return diff_str
+        diff_str = self._random.sample(self.ALLOWED_CHARACTERS, length)
+        if "".join(diff_str) == string:
+            # The characters are all distinct, so any swap
+            # makes a different string.
+            self._retries += 1
+            if length == 1:
+                return self._random.choice(
+                    self.ALLOWED_CHARACTERS.replace(string, ""))
+            i, j = self._random.sample(xrange(length), 2)
+            diff_str[i], diff_str[j] = diff_str[j], diff_str[i]
+        return "".join(diff_str)
 
     def validate_solution(self, solution):
         """
         Check that a solution works for the rows and cols.
         """
-        for i in xrange(len(self._rows)):
-            row = solution[i].upper()
-            m = self._rows[i].match(row)
-            if not m or len(m.group(0)) != self._w:
-                print("The pattern {} does not work for row {}"
-                      .format(self._rows[i].pattern, row))
-                return False
-            m = self._rows2[i].match(row)
-            if not m or len(m.group(0)) != self._w:
-                print("The pattern {} does not work for row {}"
-                      .format(self._rows2[i].pattern, row))
-                return False
-
-        for i in xrange(len(self._cols)):
-            col = reduce(lambda x, y: x + y[i], solution, "").upper()
-            m = self._cols[i].match(col)
-            if not m or len(m.group(0)) != self._h:
-                print("The pattern {} does not work for col {}"
-                      .format(self._col[i].pattern, col))
-                return False
-            m = self._cols2[i].match(col)
-            if not m or len(m.group(0)) != self._h:
-                print("The pattern {} does not work for col {}"
-                      .format(self._col2[i].pattern, col))
-                return False
-
-        return True
+        if (len(solution) != self._h or
+                any(len(row) != self._w for row in solution)):
+            return False
+        grid = [row.upper() for row in solution]
+        columns = ["".join(col) for col in zip(*grid)]
+        return all(clue.match(line)
+                   for clues, lines in ((self._rows, grid),
+                                        (self._rows2, grid),
+                                        (self._cols, columns),
+                                        (self._cols2, columns))
+                   for clue, line in zip(clues, lines))
 
     def _regex_from_string(self, string):
         """
         Generate the regex for a given string.
         """
-        patterns = [
-            self._pattern1, self._pattern2, self._pattern3, self._pattern4,
-            self._pattern5, self._pattern6, self._pattern7, self._pattern8,
-            self._pattern9, self._pattern10, self._pattern11, self._pattern12,
-            self._pattern13, self._pattern14, self._pattern15, self._pattern16,
-            self._pattern17, self._pattern18
-        ]
-        end = random.choice("+*")
-        return re.compile(random.choice(patterns)(string, end=end))
+        end = self._random.choice("+*")
+        strategies = self.patterns.candidates(string,
+                                              self._hurry("patterns"))
+        strategy = self._random.choice(strategies)
+        regex = self._compile(strategy, string, end)
+        if regex is not None:
+            return regex
+        # Too slow to reject wrong answers with: redraw from the other
+        # strategies.
+        strategies = [s for s in strategies if s is not strategy]
+        self._random.shuffle(strategies)
+        for strategy in strategies:
+            self._retries += 1
+            regex = self._compile(strategy, string, self._random.choice("+*"))
+            if regex is not None:
+                return regex
+        metrics.inc("pattern_fallbacks", reason="guard")
+        return self._decoy_regex(string)
+
+    def _compile(self, strategy, string, end):
+        """
+        Run a strategy on a string and compile the pattern, timing both
+        per strategy. None if the guard rejects the pattern.
+        """
+        if not metrics.registry.enabled:
+            pattern = self._guard(strategy.func(self, string, end=end),
+                                  string)
+            return None if pattern is None else Clue(pattern)
+        with metrics.timer("pattern", pattern=strategy.name):
+            pattern = strategy.func(self, string, end=end)
+        pattern = self._guard(pattern, string)
+        if pattern is None:
+            return None
+        with metrics.timer("compile"):
+            return Clue(pattern)
+
+    def _guard(self, pattern, string):
+        """
+        The pattern, or an equivalent one, or None if rejecting a wrong
+        answer could take a validator more than MAX_MATCH_STEPS (see
+        backtracking.guard).
+        """
+        safe = backtracking.guard(pattern, len(string),
+                                  self.MAX_MATCH_STEPS)
+        if safe != pattern:
+            metrics.inc("clues_guarded",
+                        action="rewritten" if safe else "rejected")
+        return safe
+
+    def _decoy_regex(self, string, wrong=None, other=None):
+        """
+        The last resort for a clue: a class per character holding it and
+        a random decoy, never wrong's character at that position. Cheap to
+        match, and unlike the string itself it does not give the answer
+        away. Differs from other: if the draw matches it, the first decoy
+        moves on to the next allowed character, one retry rather than a
+        redraw.
+        """
+        decoys = []
+        for i, c in enumerate(string):
+            taken = c + (wrong[i] if wrong else "")
+            decoys.append(self._random.choice(
+                [d for d in self.ALLOWED_CHARACTERS if d not in taken]))
+        regex = self._decoy_classes(string, decoys)
+        if other is not None and regex.pattern == other.pattern:
+            self._retries += 1
+            taken = string[0] + (wrong[0] if wrong else "") + decoys[0]
+            allowed = self.ALLOWED_CHARACTERS
+            start = allowed.index(decoys[0])
+            decoys[0] = next(d for d in allowed[start:] + allowed[:start]
+                             if d not in taken)
+            regex = self._decoy_classes(string, decoys)
+        return regex
+
+    @staticmethod
+    def _decoy_classes(string, decoys):
+        return Clue("".join("[" + "".join(sorted(c + d)) + "]"
+                            for c, d in zip(string, decoys)))
+
+    def _distinct_regex(self, string, other):
+        """
+        Generate a regex for the string with a different pattern than
+        other. If the first draw collides, every pattern is tried at most
+        once more in random order before falling back to _decoy_regex(),
+        so the work per clue is bounded.
+        """
+        regex = self._regex_from_string(string)
+        if regex.pattern != other.pattern:
+            return regex
+        metrics.inc("pattern_collisions")
+        strategies = list(self.patterns.candidates(
+            string, self._hurry("patterns")))
+        self._random.shuffle(strategies)
+        for strategy in strategies:
+            self._retries += 1
+            end = self._random.choice("+*")
+            regex = self._compile(strategy, string, end)
+            if regex is not None and regex.pattern != other.pattern:
+                return regex
+        self._retries += 1
+        metrics.inc("pattern_fallbacks", reason="distinct")
+        return self._decoy_regex(string, other=other)
 
     def run_many_times(self, n=10000):
         """
@@ -204,7 +763,7 @@ class RegexCrosswordGenerator(object):
         if len(string) > 5:
             return self._pattern5(string)
 
-        pos = random.randint(0, length - 1)
+        pos = self._random.randint(0, length - 1)
         patterns = []
         for i in xrange(length):
             if i == pos:
@@ -219,7 +778,7 @@ class RegexCrosswordGenerator(object):
         """
         if len(string) > 5:
             return self._pattern5(string)
-        c = random.choice(self.ALLOWED_CHARACTERS)  # Add a random character
+        c = self._random.choice(self.ALLOWED_CHARACTERS)  # Add a random character
         return "[" + "".join(sorted(set(string + c))) + "]" + end
 
     def _pattern3(self, string, length=4, end="+", **kwargs):
@@ -228,9 +787,9 @@ class RegexCrosswordGenerator(object):
         """
         if len(string) > 5:
             return self._pattern5(string)
-        c = random.choice(self.ALLOWED_CHARACTERS)  # Add a random character
+        c = self._random.choice(self.ALLOWED_CHARACTERS)  # Add a random character
         chars = set(self.ALLOWED_CHARACTERS) - set(string + c)
-        chars = random.sample(chars, length)
+        chars = self._random.sample(sorted(chars), length)
         return "[^" + "".join(sorted(chars)) + "]" + end
 
     def _pattern4(self, string, end="*", **kwargs):
@@ -240,15 +799,15 @@ class RegexCrosswordGenerator(object):
         if len(string) > 5:
             return self._pattern18(string)
         return (self._pattern1(string, 2) + "|" +
-                random.choice(self.ALLOWED_CHARACTERS) + end)
+                self._random.choice(self.ALLOWED_CHARACTERS) + end)
 
     def _pattern5(self, string, start="*", end="*", **kwargs):
         """
         .(start)c1?c2.(end)
         """
-        rand_c1 = random.choice(self.ALLOWED_CHARACTERS)
+        rand_c1 = self._random.choice(self.ALLOWED_CHARACTERS)
         if len(string) == 2:
-            rand_place = random.randint(0, 2)
+            rand_place = self._random.randint(0, 2)
             if rand_place == 0:
                 return ".+" + rand_c1 + "?" + string[1] + ".*"
             elif rand_place == 1:
@@ -256,31 +815,31 @@ class RegexCrosswordGenerator(object):
             else:
                 return ".*" + rand_c1 + "?" + string[0] + ".+"
         elif len(string) == 3:
-            use_optional = random.randint(0, 1)
+            use_optional = self._random.randint(0, 1)
             if use_optional:
-                return random.choice([
+                return self._random.choice([
                     ".*" + string[0] + "?" + string[1] + ".+",
                     ".+" + string[1] + "?" + string[2] + ".*"
                 ])
             else:
                 return ".+" + rand_c1 + "?" + string[1] + ".+"
         else:
-            use_c1 = random.randint(0, 1)
+            use_c1 = self._random.randint(0, 1)
             start_offset = 1 if start is "+" else 0
             end_offset = len(string) - (2 if end is "+" else 1)
             if use_c1:
-                i1 = random.randint(start_offset, end_offset - 1)
-                i2 = random.randint(i1, end_offset)
+                i1 = self._random.randint(start_offset, end_offset - 1)
+                i2 = self._random.randint(i1, end_offset)
                 return ".{}{}?{}.{}".format(start, string[i1], string[i2], end)
             else:
-                c2 = string[random.randint(start_offset, end_offset)]
+                c2 = string[self._random.randint(start_offset, end_offset)]
                 return ".{}{}?{}.{}".format(start, rand_c1, c2, end)
 
     def _pattern6(self, string, **kwargs):
         """
         [ccc...]+.
         """
-        cutoff = random.randint(1, len(string) / 2)
+        cutoff = self._random.randint(1, len(string) / 2)
         if cutoff < 3:
             end = "+" + "." * cutoff
         else:
@@ -295,7 +854,7 @@ class RegexCrosswordGenerator(object):
             return self._pattern6(string)
         else:
             cutoff1 = len(string) / 2
-            cutoff2 = random.randint(cutoff1 + 1, len(string) - 1)
+            cutoff2 = self._random.randint(cutoff1 + 1, len(string) - 1)
             return (self._pattern2(string[:cutoff1], end=".+") +
                     self._pattern2(string[cutoff2:]))
 
@@ -306,7 +865,7 @@ class RegexCrosswordGenerator(object):
         if len(string) < 4:
             return self._pattern1(string)
         else:
-            cutoff = random.randint(2, len(string) - 2)
+            cutoff = self._random.randint(2, len(string) - 2)
             return (self._pattern2(string[:cutoff]) +
                     "(" + self._pattern1(string[cutoff:]) + ")")
 
@@ -317,7 +876,7 @@ class RegexCrosswordGenerator(object):
         if len(string) < 4:
             return self._pattern1(string)
         else:
-            cutoff = random.randint(2, len(string) - 2)
+            cutoff = self._random.randint(2, len(string) - 2)
             return ("(" + self._pattern1(string[:cutoff]) + ")" +
                     self._pattern2(string[cutoff:]))
 
@@ -352,7 +911,7 @@ class RegexCrosswordGenerator(object):
         """
         [^ccc...]+.
         """
-        cutoff = random.randint(1, len(string) / 2)
+        cutoff = self._random.randint(1, len(string) / 2)
         if cutoff < 3:
             end = "+" + "." * cutoff
         else:
@@ -367,7 +926,7 @@ class RegexCrosswordGenerator(object):
             return self._pattern6(string)
         else:
             cutoff1 = len(string) / 2
-            cutoff2 = random.randint(cutoff1 + 1, len(string) - 1)
+            cutoff2 = self._random.randint(cutoff1 + 1, len(string) - 1)
             return (self._pattern3(string[:cutoff1], end=".+") +
                     self._pattern2(string[cutoff2:]))
 
@@ -378,7 +937,7 @@ class RegexCrosswordGenerator(object):
         if len(string) < 4:
             return self._pattern1(string)
         else:
-            cutoff = random.randint(2, len(string) - 2)
+            cutoff = self._random.randint(2, len(string) - 2)
             return (self._pattern3(string[:cutoff]) +
                     "(" + self._pattern1(string[cutoff:]) + ")")
 
@@ -389,7 +948,7 @@ class RegexCrosswordGenerator(object):
         if len(string) < 4:
             return self._pattern1(string)
         else:
-            cutoff = random.randint(2, len(string) - 2)
+            cutoff = self._random.randint(2, len(string) - 2)
             return ("(" + self._pattern1(string[:cutoff]) + ")" +
                     self._pattern3(string[cutoff:]))
 
@@ -399,8 +958,11 @@ class RegexCrosswordGenerator(object):
         """
         duplicates = set(filter(lambda x: string.count(x) > 1, string))
         if duplicates and len(set(string)) > 2:
-            c = duplicates.pop()
+            c = self._random.choice(sorted(duplicates))
             chunks = filter(lambda x: bool(x), string.split(c) + [c])
+            # The same chunk twice makes (A|B|A)+ ambiguous, which a
+            # backtracking engine pays for exponentially.
+            chunks = sorted(set(chunks), key=chunks.index)
             return "(" + "|".join(chunks) + ")" + end
         else:
             return "(" + self._pattern1(string) + ")"
@@ -415,12 +977,12 @@ class RegexCrosswordGenerator(object):
         if len(string) < 4:
             return self._pattern5(string)
         else:
-            cutoff = random.randint(2, len(string) - 2)
-            if random.randint(0, 1):
+            cutoff = self._random.randint(2, len(string) - 2)
+            if self._random.randint(0, 1):
                 first = self._pattern2(string[:cutoff], end=start)
             else:
                 first = self._pattern3(string[:cutoff], end=start)
-            if random.randint(0, 1):
+            if self._random.randint(0, 1):
                 last = self._pattern2(string[cutoff:], end=end)
             else:
                 last = self._pattern3(string[cutoff:], end=end)
@@ -434,33 +996,33 @@ class RegexCrosswordGenerator(object):
         """
         if len(string) < 5:
             return self._pattern5(string)
-        elif random.randint(0, 1):
+        elif self._random.randint(0, 1):
             # Do not use char
-            cutoff = random.randint(2, len(string) - 2)
-            if random.randint(0, 1):
+            cutoff = self._random.randint(2, len(string) - 2)
+            if self._random.randint(0, 1):
                 first = self._pattern2(string[:cutoff], end=start)
             else:
                 first = self._pattern3(string[:cutoff], end=start)
-            if random.randint(0, 1):
+            if self._random.randint(0, 1):
                 last = self._pattern2(string[cutoff:], end=end)
             else:
                 last = self._pattern3(string[cutoff:], end=end)
-            if random.randint(0, 1):
-                c = random.choice(self.ALLOWED_CHARACTERS)
+            if self._random.randint(0, 1):
+                c = self._random.choice(self.ALLOWED_CHARACTERS)
             else:
                 c = "."
             return first + c + "?" + last
         else:
-            cutoff = random.randint(2, len(string) - 3)
-            if random.randint(0, 1):
+            cutoff = self._random.randint(2, len(string) - 3)
+            if self._random.randint(0, 1):
                 c = string[cutoff]
             else:
                 c = "."
-            if random.randint(0, 1):
+            if self._random.randint(0, 1):
                 first = self._pattern2(string[:cutoff], end=start)
             else:
                 first = self._pattern3(string[:cutoff], end=start)
-            if random.randint(0, 1):
+            if self._random.randint(0, 1):
                 last = self._pattern2(string[cutoff + 1:], end=end)
             else:
                 last = self._pattern3(string[cutoff + 1:], end=end)
@@ -486,8 +1048,8 @@ class RegexCrosswordGenerator(object):
             ]
             patterns = ["", "", ""]
             for i in xrange(3):
-                end = "+" if random.randint(0, 1) else "*"
-                patterns[i] = random.choice([
+                end = "+" if self._random.randint(0, 1) else "*"
+                patterns[i] = self._random.choice([
                     self._pattern2(chunks[i], end=end),
                     self._pattern3(chunks[i], end=end),
                     "." + end,
@@ -496,6 +1058,30 @@ class RegexCrosswordGenerator(object):
             return "".join(patterns)
 
 
+# The string lengths each pattern handles without falling back to another.
+for _name, _options in (
+        ("_pattern1", dict(max_length=5)),
+        ("_pattern2", dict(max_length=5)),
+        ("_pattern3", dict(max_length=5)),
+        ("_pattern4", dict(max_length=5)),
+        ("_pattern5", dict(cheap=True)),
+        ("_pattern6", dict(max_length=6)),
+        ("_pattern7", dict(min_length=3, max_length=11, cheap=True)),
+        ("_pattern8", dict(min_length=4, max_length=7)),
+        ("_pattern9", dict(min_length=4, max_length=7)),
+        ("_pattern10", dict(needs_duplicates=True, cheap=True)),
+        ("_pattern11", dict(max_length=6)),
+        ("_pattern12", dict(min_length=3, max_length=11)),
+        ("_pattern13", dict(min_length=4, max_length=7)),
+        ("_pattern14", dict(min_length=4, max_length=7)),
+        ("_pattern15", dict(needs_duplicates=True, min_distinct=3)),
+        ("_pattern16", dict(min_length=4, max_length=7)),
+        ("_pattern17", dict(min_length=5, max_length=7)),
+        ("_pattern18", dict(min_length=6, max_length=15))):
+    RegexCrosswordGenerator.patterns.register(
+        vars(RegexCrosswordGenerator)[_name], **_options)
+
+
 def main():
     x = RegexCrosswordGenerator(2, 4)
     x.run_many_times()
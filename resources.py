@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Files the app reads at startup instead of on every request.
+
+The subheaders are parsed once into an immutable snapshot, together with
+the modification times of the subheaders and templates. With reloading
+on, the files are stat'ed at most once per interval and a new snapshot
+replaces the old one when any of them changed, so requests never open a
+file themselves.
+
+Corpus texts are not watched: they are loaded once per process (see
+corpus.load_corpus), and puzzle ids are only rebuilt exactly from the
+corpus they were made from.
+"""
+from __future__ import print_function
+
+import os
+import json
+import time
+import threading
+from collections import namedtuple
+
+from corpus import ROOT
+
+
+SUBHEADERS = "subheaders.json"
+TEMPLATES = "templates"
+
+# subheaders: tuple of strings, mtimes: tuple of (path, mtime) pairs for
+# every watched file, relative to the root.
+Resources = namedtuple("Resources", ["subheaders", "mtimes"])
+
+
+def watched_files(root=ROOT):
+    """
+    The files a snapshot depends on, relative to root.
+    """
+    paths = [SUBHEADERS]
+    templates = os.path.join(root, TEMPLATES)
+    if os.path.isdir(templates):
+        paths.extend(os.path.join(TEMPLATES, name)
+                     for name in sorted(os.listdir(templates)))
+    return paths
+
+
+def _mtimes(root):
+    mtimes = []
+    for path in watched_files(root):
+        try:
+            mtime = os.path.getmtime(os.path.join(root, path))
+        except OSError:
+            mtime = None
+        mtimes.append((path, mtime))
+    return tuple(mtimes)
+
+
+def load_resources(root=ROOT):
+    """
+    A fresh snapshot of the files under root.
+    """
+    mtimes = _mtimes(root)
+    with open(os.path.join(root, SUBHEADERS)) as f:
+        subheaders = tuple(json.load(f))
+    return Resources(subheaders, mtimes)
+
+
+class ResourceLoader(object):
+    """
+    Hands out the current snapshot. With reload on, checks the watched
+    files' modification times at most every interval seconds and loads a
+    new snapshot when they changed. Safe to call from any thread.
+    """
+
+    def __init__(self, root=ROOT, reload=False, interval=2.0):
+        self.root = root
+        self.reload = reload
+        self.interval = interval
+        self._resources = load_resources(root)
+        self._checked = time.time()
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self.reload and time.time() - self._checked >= self.interval:
+            with self._lock:
+                if time.time() - self._checked >= self.interval:
+                    self._checked = time.time()
+                    if _mtimes(self.root) != self._resources.mtimes:
+                        self._load()
+        return self._resources
+
+    def _load(self):
+        try:
+            self._resources = load_resources(self.root)
+        except (IOError, ValueError):
+            # Half written or broken files; keep serving the last good
+            # snapshot and try again after the next interval.
+            pass
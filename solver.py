@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Count the solutions of a regex crossword.
+
+Every clue is compiled into a small automaton over the allowed
+characters (see regex_automaton). Each cell holds a bitmask of the
+characters it may still take. Lines (rows and cols) are filtered against
+their clues with one forward and one backward pass over the automaton
+until nothing changes, then the search branches on the cell with the
+fewest candidates. Before the first pass every cell is narrowed by what
+its row and col clues allow there on their own, in one bulk intersection
+over a CandidateGrid, which leaves the line filters less to do.
+
+Backreferences cannot be expressed by the masks, so they are treated as
+any character while filtering. Where a group and its backreference sit
+at fixed positions in the line (as in every _pattern10 clue) they become
+equality constraints between two cells instead. Every full grid is
+checked against the clues exactly before it is counted.
+"""
+from __future__ import print_function
+
+import operator
+
+from candidate_grid import CandidateGrid, line_cells
+from regex_automaton import (ALLOWED_CHARACTERS, ALL, automaton, chars,
+                             popcount)
+
+
+##########################################
+# SOLVING
+##########################################
+
+class Solver(object):
+    """
+    Finds the solutions of a puzzle given the clues for each row and col.
+    rows[i] and cols[i] are lists of patterns (strings or compiled) that
+    the row or col must all match. make_automaton builds the automaton
+    of a pattern, by default from the shared cache.
+    """
+
+    def __init__(self, width, height, rows, cols, make_automaton=automaton):
+        self.width = width
+        self.height = height
+        self._rows = [[getattr(p, "pattern", p) for p in clues]
+                      for clues in rows]
+        self._cols = [[getattr(p, "pattern", p) for p in clues]
+                      for clues in cols]
+        self._automata = (
+            [map(make_automaton, clues) for clues in self._rows] +
+            [map(make_automaton, clues) for clues in self._cols])
+        # The cells of every line, rows then cols.
+        self._cells = [line_cells(width, height, line)
+                       for line in xrange(height + width)]
+        self._equalities = [
+            sorted(set(pair for a in automata
+                       for pair in a.equalities(len(self._cells[line]))))
+            for line, automata in enumerate(self._automata)
+        ]
+
+    def _line_masks(self, line):
+        length = len(self._cells[line])
+        masks = [ALL] * length
+        for a in self._automata[line]:
+            found = a.positions(length) or [0] * length
+            masks = map(operator.and_, masks, found)
+        return masks
+
+    def candidates(self):
+        """
+        A CandidateGrid of what each cell may be by its row and col clues
+        read on their own (see Automaton.positions).
+        """
+        h = self.height
+        masks = [self._line_masks(line)
+                 for line in xrange(h + self.width)]
+        grid = CandidateGrid(self.width, h)
+        grid.intersect(masks[:h], masks[h:])
+        return grid
+
+    def propagate(self, domains, lines=None):
+        """
+        Filter domains in place until every line is consistent with its
+        clues. Only the given lines are checked at first. Returns False
+        on a contradiction.
+        """
+        w, h = self.width, self.height
+        if lines is None:
+            lines = range(h + w)
+        queued = set(lines)
+        todo = list(lines)
+        while todo:
+            line = todo.pop()
+            queued.discard(line)
+            cells = self._cells[line]
+            values = self._filter(line, [domains[i] for i in cells])
+            if values is None:
+                return False
+            for i, value in zip(cells, values):
+                if value != domains[i]:
+                    domains[i] = value
+                    cross = h + i % w if line < h else i // w
+                    if cross not in queued:
+                        queued.add(cross)
+                        todo.append(cross)
+        return True
+
+    def _filter(self, line, values):
+        """
+        Narrow the masks of one line by its clues and backreference
+        equalities until they stop changing.
+        """
+        while True:
+            before = values
+            for a in self._automata[line]:
+                values = a.filter(values)
+                if values is None:
+                    return None
+            for i, j in self._equalities[line]:
+                value = values[i] & values[j]
+                if not value:
+                    return None
+                values[i] = values[j] = value
+            if values == before:
+                return values
+
+    def _check(self, domains):
+        w = self.width
+        grid = ["".join(chars(domains[r * w + c])[0] for c in xrange(w))
+                for r in xrange(self.height)]
+        for line, automata in enumerate(self._automata):
+            if not any(a.has_backrefs for a in automata):
+                continue
+            string = "".join(grid[i // w][i % w] for i in self._cells[line])
+            if not all(a.matches(string) for a in automata):
+                return None
+        return grid
+
+    def solve(self, limit=2):
+        """
+        Up to limit solutions of the puzzle, each as a list of row
+        strings.
+        """
+        domains = list(self.candidates())
+        found = []
+        if 0 not in domains and self.propagate(domains):
+            self._search(domains, found, limit)
+        return found
+
+    def count_solutions(self, limit=2):
+        return len(self.solve(limit))
+
+    def _search(self, domains, found, limit):
+        best = None
+        best_count = len(ALLOWED_CHARACTERS) + 1
+        for i, mask in enumerate(domains):
+            if mask & (mask - 1):
+                count = popcount(mask)
+                if count < best_count:
+                    best, best_count = i, count
+                    if count == 2:
+                        break
+        if best is None:
+            grid = self._check(domains)
+            if grid is not None:
+                found.append(grid)
+            return
+
+        w = self.width
+        lines = [best // w, self.height + best % w]
+        mask = domains[best]
+        while mask and len(found) < limit:
+            bit = mask & -mask
+            mask ^= bit
+            branch = list(domains)
+            branch[best] = bit
+            if self.propagate(branch, lines):
+                self._search(branch, found, limit)
+
+
+def count_solutions(width, height, rows, cols, limit=2):
+    """
+    Count the solutions of a puzzle, stopping once limit are found.
+    """
+    return Solver(width, height, rows, cols).count_solutions(limit)
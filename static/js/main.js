@@ -4,4 +4,129 @@ function failedValidation(){
 
 function successfulValidation(){
     $(".check").removeClass("btn-primary btn-danger").addClass("btn-success").text("Valid!");
-}
\ No newline at end of file
+}
+
+function showHint(validator, hint){
+    if (hint.solved){
+        successfulValidation();
+        return;
+    }
+    validator.set(hint.row, hint.col, hint.value);
+    $(validator.inputs[hint.row][hint.col]).focus().select();
+}
+
+function resetValidation(){
+    $(".check").removeClass("btn-success btn-danger").addClass("btn-primary").text("Validate");
+}
+
+function escapeHtml(text){
+    return $("<div>").text(text).html();
+}
+
+// Build the board for a puzzle as served by the json api, replacing any
+// board already on the page, and return its validator.
+// A javascript-enhanced crossword puzzle [c] Jesse Weisbeck, MIT/GPL
+function showPuzzle(puzzle, double){
+    var entries = [], rows = [], cols = [], x, y;
+    var clue = function(patterns){
+        return $.map(patterns, escapeHtml).join("<br>");
+    };
+    for (y = 0; y < puzzle.height; y++){
+        rows.push(double ? [puzzle.rows[y], puzzle.rows2[y]] : [puzzle.rows[y]]);
+        entries.push({
+            clue: clue(rows[y]),
+            answer: new Array(puzzle.width + 1).join("0"),
+            position: y + 1,
+            orientation: "across",
+            startx: 1,
+            starty: y + 1
+        });
+    }
+    for (x = 0; x < puzzle.width; x++){
+        cols.push(double ? [puzzle.cols[x], puzzle.cols2[x]] : [puzzle.cols[x]]);
+        entries.push({
+            clue: clue(cols[x]),
+            answer: new Array(puzzle.height + 1).join("0"),
+            position: x + 1,
+            orientation: "down",
+            startx: x + 1,
+            starty: 1
+        });
+    }
+    // The plugin puts the clues before the wrapper and binds its handlers
+    // on it, so drop both before building another board.
+    $("#puzzle-clues").remove();
+    $("#puzzle-wrapper").off().empty().crossword(entries);
+    return new CrosswordValidator(rows, cols);
+}
+
+/**
+ * A puzzle page. The page itself is the same for every puzzle of a kind,
+ * the puzzle is fetched as json from dataUrl once the page is ready (or
+ * from /api/puzzle/<id>/ for a shared /puzzle/<id>/ page), and "New board"
+ * fetches the next one from nextUrl. The query string is passed on, e.g.
+ * the w and h of a custom puzzle.
+ */
+function PuzzlePage(options){
+    var self = this;
+    this.options = options;
+    this.puzzle = null;
+    this.validator = null;
+
+    $(function(){
+        var subheaders = options.subheaders;
+        if (subheaders.length){
+            $(".subheader").text(subheaders[Math.floor(Math.random() * subheaders.length)]);
+        }
+        self.load((options.dataUrl || "/api" + location.pathname) + location.search);
+
+        $(".check").click(function(){
+            if (self.validator && self.validator.valid()){
+                successfulValidation();
+            } else {
+                failedValidation();
+            }
+        });
+        $(".clear").click(function(){
+            if (self.validator) self.validator.clear();
+        });
+        $(".hint").click(function(){
+            self.hint();
+        });
+        $(".new").click(function(){
+            self.load(options.nextUrl + location.search);
+        });
+    });
+}
+
+PuzzlePage.prototype.load = function(url){
+    var self = this;
+    $.getJSON(url, function(puzzle){
+        self.show(puzzle);
+    }).fail(function(){
+        self.puzzle = self.validator = null;
+        $(".hint, .puzzle-link").hide();
+        $("#puzzle-clues").remove();
+        $("#puzzle-wrapper").off().empty().text("Could not load the puzzle.");
+    });
+};
+
+PuzzlePage.prototype.show = function(puzzle){
+    var double = this.options.double;
+    var link = puzzle.id ? "/puzzle/" + puzzle.id + "/" + (double ? "?double=1" : "") : null;
+    this.puzzle = puzzle;
+    this.validator = showPuzzle(puzzle, double);
+    resetValidation();
+    $(".puzzle-link").attr("href", link).toggle(!!link);
+    $(".hint").toggle(!!puzzle.id);
+};
+
+PuzzlePage.prototype.hint = function(){
+    var validator = this.validator, params;
+    if (!this.puzzle || !this.puzzle.id) return;
+    params = {grid: validator.grid(".").join(",")};
+    if (this.options.double) params.double = 1;
+    $.getJSON("/api/puzzle/" + this.puzzle.id + "/hint", params, function(hint){
+        showHint(validator, hint);
+    });
+};
@@ -0,0 +1,136 @@
+/**
+ * Live validation for a regex crossword built by jquery.crossword.js.
+ *
+ * The cell inputs are looked up once and kept in a 2D array, and every
+ * clue is compiled once into a RegExp anchored around the whole pattern
+ * (/^(?:A|B)$/, not /^A|B$/, which would match anything starting with A).
+ * Typing in a cell only rechecks its row and column, and marks their
+ * clues valid or invalid once they are full.
+ *
+ * rows[y] and cols[x] are the lists of patterns a row or column must all
+ * match.
+ */
+function CrosswordValidator(rows, cols){
+    var self = this;
+    this.height = rows.length;
+    this.width = cols.length;
+    this.rowPatterns = $.map(rows, compileClues);
+    this.colPatterns = $.map(cols, compileClues);
+    this.rowClues = $("#across li");
+    this.colClues = $("#down li");
+    this.rowOk = [];
+    this.colOk = [];
+
+    // inputs[y][x], from the data-coords="x,y" (1 based) of each cell.
+    this.inputs = [];
+    for (var y = 0; y < this.height; y++){
+        this.inputs.push(new Array(this.width));
+    }
+    $("#puzzle td").each(function(){
+        var xy = this.getAttribute("data-coords").split(",");
+        var x = +xy[0] - 1, y = +xy[1] - 1;
+        var input = this.getElementsByTagName("input")[0];
+        self.inputs[y][x] = input;
+        $(input).on("input", function(){
+            self.update(y, x);
+        });
+    });
+    this.checkAll();
+}
+
+function compileClues(patterns){
+    // $.map flattens returned arrays, so wrap the list once more.
+    return [$.map(patterns, function(pattern){
+        return new RegExp("^(?:" + pattern + ")$");
+    })];
+}
+
+CrosswordValidator.prototype.value = function(y, x){
+    return (this.inputs[y][x].value || " ").charAt(0).toUpperCase();
+};
+
+CrosswordValidator.prototype.row = function(y){
+    var s = "";
+    for (var x = 0; x < this.width; x++){
+        s += this.value(y, x);
+    }
+    return s;
+};
+
+CrosswordValidator.prototype.col = function(x){
+    var s = "";
+    for (var y = 0; y < this.height; y++){
+        s += this.value(y, x);
+    }
+    return s;
+};
+
+function checkLine(patterns, line, clue){
+    var full = line.indexOf(" ") < 0;
+    var ok = full;
+    for (var i = 0; ok && i < patterns.length; i++){
+        ok = patterns[i].test(line);
+    }
+    $(clue).toggleClass("clue-valid", ok)
+           .toggleClass("clue-invalid", full && !ok);
+    return ok;
+}
+
+CrosswordValidator.prototype.checkRow = function(y){
+    this.rowOk[y] = checkLine(this.rowPatterns[y], this.row(y),
+                              this.rowClues[y]);
+};
+
+CrosswordValidator.prototype.checkCol = function(x){
+    this.colOk[x] = checkLine(this.colPatterns[x], this.col(x),
+                              this.colClues[x]);
+};
+
+// Recheck the row and column through one cell.
+CrosswordValidator.prototype.update = function(y, x){
+    this.checkRow(y);
+    this.checkCol(x);
+};
+
+CrosswordValidator.prototype.checkAll = function(){
+    for (var y = 0; y < this.height; y++){
+        this.checkRow(y);
+    }
+    for (var x = 0; x < this.width; x++){
+        this.checkCol(x);
+    }
+};
+
+CrosswordValidator.prototype.set = function(y, x, value){
+    this.inputs[y][x].value = value;
+    this.update(y, x);
+};
+
+CrosswordValidator.prototype.clear = function(){
+    for (var y = 0; y < this.height; y++){
+        for (var x = 0; x < this.width; x++){
+            this.inputs[y][x].value = "";
+        }
+    }
+    this.checkAll();
+};
+
+// Whether every row and column matches its clues, from the last checks.
+CrosswordValidator.prototype.valid = function(){
+    for (var y = 0; y < this.height; y++){
+        if (!this.rowOk[y]) return false;
+    }
+    for (var x = 0; x < this.width; x++){
+        if (!this.colOk[x]) return false;
+    }
+    return true;
+};
+
+// The rows as strings, with blank for empty cells.
+CrosswordValidator.prototype.grid = function(blank){
+    var rows = [];
+    for (var y = 0; y < this.height; y++){
+        rows.push(this.row(y).replace(/ /g, blank || " "));
+    }
+    return rows;
+};
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Catching clues that a backtracking engine is slow to reject, and the
+generator redrawing them.
+"""
+from __future__ import print_function
+
+import unittest
+
+import backtracking
+from regex_generator import PatternRegistry, RegexCrosswordGenerator
+
+
+class MatchCostTest(unittest.TestCase):
+
+    def test_exponential(self):
+        cost = backtracking.match_cost("(A|AA)*B", 20)
+        self.assertTrue(cost.exponential)
+        self.assertGreaterEqual(cost.steps, 2 ** 20)
+        self.assertTrue(backtracking.match_cost("(.|..)+", 12).exponential)
+
+    def test_polynomial(self):
+        cost = backtracking.match_cost(".*X?Y.+", 12)
+        self.assertFalse(cost.exponential)
+        self.assertEqual(cost.degree, 2)
+        self.assertFalse(backtracking.match_cost("[AB]+C", 12).exponential)
+
+    def test_guard(self):
+        self.assertIsNone(backtracking.guard("(A|AA)*B", 20))
+        self.assertEqual(backtracking.guard("(A|AA)*B", 4), "(A|AA)*B")
+        self.assertIsNone(backtracking.guard("(.|..)+", 12, max_steps=1000))
+        # The same strings without the redundant quantifiers.
+        self.assertEqual(backtracking.guard(".*X?.+", 12, max_steps=50),
+                         ".+")
+
+
+def ambiguous(x, string, **kwargs):
+    return "(.|..)+"
+
+
+def columns(x):
+    return ["".join(col) for col in zip(*x.possible_solution)]
+
+
+class Ambiguous(RegexCrosswordGenerator):
+    patterns = PatternRegistry()
+    MAX_MATCH_STEPS = 1000
+
+
+Ambiguous.patterns.register(ambiguous)
+
+
+class GeneratorGuardTest(unittest.TestCase):
+
+    def clues(self, x):
+        grid = x.possible_solution
+        return (zip(x.rows, grid) + zip(x.rows2, grid) +
+                zip(x.cols, columns(x)) + zip(x.cols2, columns(x)))
+
+    def test_never_the_answer(self):
+        for seed in xrange(5):
+            x = Ambiguous(12, 12, seed=seed)
+            for regex, answer in self.clues(x):
+                self.assertNotEqual(regex.pattern, answer)
+                self.assertNotEqual(regex.pattern, "(.|..)+")
+                self.assertTrue(regex.match(answer))
+            self.assertTrue(x.validate_solution(x.possible_solution))
+
+    def test_short_lines_keep_the_clue(self):
+        x = Ambiguous(3, 3, seed=0)
+        self.assertEqual([r.pattern for r in x.rows], ["(.|..)+"] * 3)
+
+    def test_redrawn_from_another_strategy(self):
+        class Mixed(Ambiguous):
+            patterns = PatternRegistry()
+            MAX_MATCH_STEPS = 16
+        Mixed.patterns.register(ambiguous)
+        Mixed.patterns.register(RegexCrosswordGenerator._pattern2.im_func,
+                                max_length=5)
+        x = Mixed(5, 5, seed=1)
+        for regex, answer in self.clues(x):
+            self.assertTrue(regex.pattern.startswith("["), regex.pattern)
+            self.assertTrue(regex.match(answer))
+
+
+if __name__ == "__main__":
+    unittest.main()
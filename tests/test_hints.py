@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Hints for players sharing a puzzle.
+"""
+from __future__ import print_function
+
+import random
+import unittest
+
+from hints import HintState
+from regex_generator import RegexCrosswordGenerator
+
+
+def clue_lists(x):
+    return [[r] for r in x.rows], [[c] for c in x.cols]
+
+
+def partial(solution, rng, share):
+    return ["".join(c if rng.random() < share else "." for c in row)
+            for row in solution]
+
+
+class HintStateTest(unittest.TestCase):
+
+    def test_players_keep_their_own_grids(self):
+        x = RegexCrosswordGenerator(6, 6, seed=4)
+        solution = x.possible_solution
+        rows, cols = clue_lists(x)
+        shared = HintState(6, 6, rows, cols, solution)
+        rng = random.Random(0)
+        # Two players filling in cells, taking turns asking for hints.
+        grids = [partial(solution, rng, 0.2), partial(solution, rng, 0.4)]
+        for turn in xrange(10):
+            grid = grids[turn % 2]
+            fresh = HintState(6, 6, rows, cols, solution)
+            self.assertEqual(shared.hint(grid), fresh.hint(grid))
+            row, col, value, candidates = shared.hint(grid)
+            grid[row] = grid[row][:col] + value + grid[row][col + 1:]
+
+    def test_solved(self):
+        x = RegexCrosswordGenerator(3, 3, seed=1)
+        rows, cols = clue_lists(x)
+        state = HintState(3, 3, rows, cols, x.possible_solution)
+        self.assertIsNone(state.hint(list(x.possible_solution)))
+        self.assertIsNotNone(state.hint(["", "", ""]))
+
+
+if __name__ == "__main__":
+    unittest.main()
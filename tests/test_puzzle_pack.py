@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Writing puzzle packs and reading them back.
+"""
+from __future__ import print_function
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from puzzle_pack import (PuzzlePack, write_pack, encode_puzzle,
+                         decode_puzzle, zstandard)
+from regex_generator import RegexCrosswordGenerator
+
+
+def puzzles(n, solution=True):
+    rng = random.Random(1)
+    for seed in xrange(n):
+        x = RegexCrosswordGenerator(rng.randint(2, 12), rng.randint(2, 12),
+                                    seed=seed)
+        # Work the score out, so that to_dict() includes it.
+        x.score
+        yield x.to_dict(solution=solution)
+
+
+class PackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "test.rxp")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_encode_decode(self):
+        for puzzle in puzzles(10):
+            self.assertEqual(decode_puzzle(encode_puzzle(puzzle)), puzzle)
+        puzzle = next(puzzles(1, solution=False))
+        puzzle["id"] = puzzle["score"] = None
+        self.assertEqual(decode_puzzle(encode_puzzle(puzzle)), puzzle)
+
+    def test_round_trip(self):
+        codecs = ["none", "zlib"] + (["zstd"] if zstandard else [])
+        expected = list(puzzles(30))
+        for codec in codecs:
+            self.assertEqual(write_pack(self.path, expected, codec), 30)
+            with PuzzlePack(self.path) as pack:
+                self.assertEqual(pack.codec, codec)
+                self.assertEqual(len(pack), 30)
+                self.assertEqual(list(pack), expected)
+                self.assertEqual(pack[-1], expected[-1])
+                self.assertEqual(pack[7], expected[7])
+                self.assertRaises(IndexError, lambda: pack[30])
+                self.assertIn(pack.random(random.Random(0)), expected)
+
+    def test_random_in_score_range(self):
+        expected = list(puzzles(30))
+        write_pack(self.path, expected)
+        scores = sorted(p["score"] for p in expected)
+        low, high = scores[10], scores[20]
+        rng = random.Random(0)
+        with PuzzlePack(self.path) as pack:
+            for i in xrange(20):
+                puzzle = pack.random(rng, low, high)
+                self.assertTrue(low <= puzzle["score"] <= high)
+            self.assertIsNone(pack.random(rng, min_score=scores[-1] + 1))
+
+    def test_scores_unscored_puzzles(self):
+        expected = list(puzzles(5))
+        write_pack(self.path, [dict(p, score=None) for p in expected])
+        with PuzzlePack(self.path) as pack:
+            self.assertEqual(list(pack), expected)
+
+    def test_empty_pack(self):
+        self.assertEqual(write_pack(self.path, []), 0)
+        with PuzzlePack(self.path) as pack:
+            self.assertEqual(len(pack), 0)
+            self.assertEqual(list(pack), [])
+            self.assertIsNone(pack.random())
+            self.assertRaises(IndexError, lambda: pack[0])
+
+    def test_not_a_pack(self):
+        for data in (b"", b"RXPK", b"x" * 100):
+            with open(self.path, "wb") as f:
+                f.write(data)
+            with self.assertRaises(ValueError) as cm:
+                PuzzlePack(self.path)
+            self.assertIn("not a puzzle pack", str(cm.exception))
+
+    def test_truncated(self):
+        write_pack(self.path, puzzles(3))
+        with open(self.path, "rb") as f:
+            data = f.read()
+        with open(self.path, "wb") as f:
+            f.write(data[:-4])
+        self.assertRaises(ValueError, PuzzlePack, self.path)
+
+    def test_failed_write_keeps_old_pack(self):
+        write_pack(self.path, puzzles(3))
+
+        def failing():
+            for i, puzzle in enumerate(puzzles(5)):
+                if i == 2:
+                    raise RuntimeError("generator failed")
+                yield puzzle
+
+        self.assertRaises(RuntimeError, write_pack, self.path, failing())
+        self.assertEqual(os.listdir(self.dir), ["test.rxp"])
+        with PuzzlePack(self.path) as pack:
+            self.assertEqual(list(pack), list(puzzles(3)))
+
+        os.remove(self.path)
+        self.assertRaises(RuntimeError, write_pack, self.path, failing())
+        self.assertEqual(os.listdir(self.dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Refilling puzzle pools in the background.
+"""
+from __future__ import print_function
+
+import sys
+import time
+import unittest
+from io import BytesIO
+
+from puzzle_pool import PuzzlePool
+
+
+def wait(condition, timeout=5.0):
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.01)
+    return condition()
+
+
+class PoolTest(unittest.TestCase):
+
+    def setUp(self):
+        # The workers print the tracebacks of failed refills.
+        self.stderr, sys.stderr = sys.stderr, BytesIO()
+
+    def tearDown(self):
+        sys.stderr = self.stderr
+
+    def test_refill(self):
+        pool = PuzzlePool(low_watermark=2, high_watermark=5, workers=1)
+        counter = iter(xrange(1000))
+        factory = lambda: next(counter)
+        self.assertEqual(pool.get("k", factory), 0)
+        self.assertTrue(wait(lambda: pool.stats()["k"]["size"] == 5))
+        self.assertEqual(pool.get("k", factory), 1)
+        stats = pool.stats()["k"]
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_failing_factory_pauses_refilling(self):
+        pool = PuzzlePool(low_watermark=2, high_watermark=5, workers=1,
+                          max_failures=3, backoff=0.2)
+        calls = []
+
+        def factory():
+            calls.append(1)
+            raise IOError("missing corpus")
+
+        def get():
+            self.assertEqual(pool.get("k", factory, lambda: "fallback"),
+                             "fallback")
+            wait(lambda: not pool._pools["k"].refilling)
+
+        for i in xrange(10):
+            get()
+        stats = pool.stats()["k"]
+        self.assertTrue(stats["paused"])
+        self.assertEqual(stats["errors"], 3)
+        self.assertEqual(len(calls), 3)
+
+        # Retried once the pause is over, then paused for twice as long.
+        self.assertTrue(wait(lambda: not pool.stats()["k"]["paused"]))
+        get()
+        self.assertEqual(len(calls), 4)
+        paused = pool._pools["k"].paused_until - time.time()
+        self.assertTrue(0.2 < paused <= 0.4)
+        get()
+        self.assertEqual(len(calls), 4)
+
+    def test_success_resets_failures(self):
+        pool = PuzzlePool(low_watermark=1, high_watermark=2, workers=1,
+                          max_failures=2)
+        results = iter([IOError(), 1, 2, IOError(), 3, 4])
+
+        def factory():
+            result = next(results)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        for i in xrange(4):
+            pool.get("k", factory, lambda: None)
+            wait(lambda: not pool._pools["k"].refilling)
+        self.assertFalse(pool.stats()["k"]["paused"])
+
+
+if __name__ == "__main__":
+    unittest.main()
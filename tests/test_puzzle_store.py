@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Storing puzzles and looking them up by size, difficulty and score.
+"""
+from __future__ import print_function
+
+import os
+import json
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from puzzle_store import PuzzleStore, DIFFICULTIES, difficulty_of
+from regex_generator import RegexCrosswordGenerator
+
+
+def puzzles(sizes, **kwargs):
+    for seed, (w, h) in enumerate(sizes):
+        yield RegexCrosswordGenerator(w, h, seed=seed,
+                                      **kwargs).to_dict(solution=True)
+
+
+class StoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "puzzles.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_difficulty_of(self):
+        self.assertEqual(difficulty_of(3, 3, "words", 5.0), "beginner")
+        self.assertEqual(difficulty_of(3, 3, "words", 30.0), None)
+        self.assertEqual(difficulty_of(9, 8, "alice", 60.0), "expert")
+        self.assertEqual(difficulty_of(9, 8, "words", 20.0), None)
+        self.assertEqual(difficulty_of(9, 8, "random", 0.0), "random")
+        self.assertEqual(difficulty_of(12, 12, "random", 0.0), None)
+
+    def test_scores(self):
+        store = PuzzleStore(self.path)
+        added = list(puzzles([(w, w) for w in xrange(2, 11)]))
+        for puzzle in added[::2]:
+            del puzzle["score"]
+        self.assertEqual(store.add_many(added), len(added))
+        stored = list(store.puzzles())
+        self.assertTrue(all(p["score"] is not None for p in stored))
+        scores = [p["score"] for p in stored]
+        low, high = sorted(scores)[2], sorted(scores)[6]
+        self.assertEqual(store.count(min_score=low, max_score=high), 5)
+        self.assertEqual(store.count(max_score=low), 3)
+        for i in xrange(10):
+            puzzle = store.random(min_score=low, max_score=high,
+                                  corpus="random")
+            self.assertTrue(low <= puzzle["score"] <= high)
+        self.assertIsNone(store.random(min_score=max(scores) + 1))
+
+    def test_difficulty_needs_band(self):
+        store = PuzzleStore(self.path)
+        store.add_many(puzzles([(w, h) for w in xrange(2, 5)
+                                for h in xrange(2, 5)], use_real_words=True))
+        low, high = DIFFICULTIES["beginner"][3]
+        beginners = list(store.puzzles(difficulty="beginner"))
+        self.assertEqual(len(beginners), store.count(max_score=high))
+        self.assertTrue(all(p["score"] <= high for p in beginners))
+
+    def test_old_store_gets_scores(self):
+        conn = sqlite3.connect(self.path)
+        conn.executescript("""
+            CREATE TABLE puzzles (
+                id INTEGER PRIMARY KEY, puzzle_id TEXT UNIQUE,
+                width INTEGER NOT NULL, height INTEGER NOT NULL,
+                corpus TEXT, difficulty TEXT, rand INTEGER NOT NULL,
+                data TEXT NOT NULL);
+        """)
+        for i, puzzle in enumerate(puzzles([(4, 4), (6, 5)])):
+            del puzzle["score"]
+            conn.execute(
+                "INSERT INTO puzzles (puzzle_id, width, height, corpus, "
+                "difficulty, rand, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (puzzle["id"], puzzle["width"], puzzle["height"], "random",
+                 "random", i, json.dumps(puzzle)))
+        conn.commit()
+        conn.close()
+        store = PuzzleStore(self.path)
+        stored = list(store.puzzles())
+        self.assertEqual(len(stored), 2)
+        self.assertTrue(all(p["score"] is not None for p in stored))
+        self.assertEqual(store.count(min_score=0), 2)
+
+    def test_queries_use_indexes(self):
+        store = PuzzleStore(self.path)
+        conn = store._connection()
+        for query in ("difficulty = 'expert' AND corpus = 'words'",
+                      "corpus = 'random' AND score >= 3"):
+            plan = " ".join(row[-1] for row in conn.execute(
+                "EXPLAIN QUERY PLAN SELECT data FROM puzzles WHERE " +
+                query))
+            self.assertIn("INDEX", plan)
+
+
+if __name__ == "__main__":
+    unittest.main()
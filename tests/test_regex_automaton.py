@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+The automata checked against re on random clues and strings.
+"""
+from __future__ import print_function
+
+import random
+import re
+import unittest
+
+from regex_automaton import (ALLOWED_CHARACTERS, BITS, Automaton,
+                             parse)
+from regex_generator import RegexCrosswordGenerator
+
+
+def random_string(rng, length):
+    """
+    Distinct characters like random grids, or repeats like words.
+    """
+    if rng.randint(0, 1):
+        return "".join(rng.sample(ALLOWED_CHARACTERS, length))
+    return "".join(rng.choice(ALLOWED_CHARACTERS[:6])
+                   for i in xrange(length))
+
+
+def variants(rng, string):
+    """
+    Strings near the one a clue was made from, which it may or may not
+    match.
+    """
+    yield string
+    yield string[:-1]
+    yield string + rng.choice(ALLOWED_CHARACTERS)
+    yield string[::-1]
+    for i in xrange(4):
+        k = rng.randrange(len(string))
+        yield string[:k] + rng.choice(ALLOWED_CHARACTERS) + string[k + 1:]
+    for i in xrange(4):
+        yield random_string(rng, len(string))
+
+
+def clues(seed, count):
+    """
+    (pattern, string) pairs: every strategy on random strings, then the
+    clues of generated puzzles.
+    """
+    rng = random.Random(seed)
+    x = RegexCrosswordGenerator(2, 2, seed=seed)
+    for i in xrange(count):
+        string = random_string(rng, rng.randint(2, 12))
+        for strategy in x.patterns.candidates(string):
+            end = rng.choice("+*")
+            yield strategy.func(x, string, end=end), string
+    for size in (2, 5, 8, 12):
+        x = RegexCrosswordGenerator(size, size, seed=seed)
+        grid = x.possible_solution
+        columns = ["".join(col) for col in zip(*grid)]
+        for lines, strings in (((x.rows, x.rows2), grid),
+                               ((x.cols, x.cols2), columns)):
+            for regexes in lines:
+                for regex, string in zip(regexes, strings):
+                    yield regex.pattern, string
+
+
+class DifferentialTest(unittest.TestCase):
+
+    def check(self, pattern, strings):
+        a = Automaton(pattern)
+        regex = re.compile("(?:" + pattern + r")\Z")
+        for s in strings:
+            expected = regex.match(s) is not None
+            self.assertEqual(a.matches(s), expected, (pattern, s))
+            if not s:
+                continue
+            masks = a.positions(len(s))
+            if expected:
+                # Every character of a match is allowed where it is.
+                self.assertIsNotNone(masks, (pattern, s))
+                for c, mask in zip(s, masks):
+                    self.assertTrue(BITS[c] & mask, (pattern, s))
+            if not a.exact or "\\" in pattern:
+                continue
+            # Without backreferences the masks are exact: a single
+            # string survives the filter only if it matches.
+            narrowed = a.filter([BITS[c] for c in s])
+            self.assertEqual(narrowed is not None, expected, (pattern, s))
+
+    def test_generated_clues(self):
+        for seed in xrange(6):
+            rng = random.Random(seed)
+            for pattern, string in clues(seed, 40):
+                self.check(pattern, variants(rng, string))
+
+    def test_hand_written_clues(self):
+        rng = random.Random(0)
+        for pattern in ("A|BC|D+", "[^ABC]*D?", "(A|B)\\1C", ".{3}",
+                        "(.)(.)\\2\\1", "((A|B)C)+", "A?B?C?", "[XY]+.*"):
+            strings = ["".join(rng.choice("ABCDXY")
+                               for i in xrange(rng.randint(0, 6)))
+                       for i in xrange(300)]
+            self.check(pattern, strings)
+
+    def test_unsupported(self):
+        for pattern in ("A\\w", "(A", "A)", "[AB", "\\"):
+            self.assertRaises(ValueError, parse, pattern)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Generated puzzles checking out, and tightening them until they have
+exactly one solution.
+"""
+from __future__ import print_function
+
+import unittest
+
+import difficulty
+import regex_automaton
+from regex_generator import Clue, RegexCrosswordGenerator
+from solver import count_solutions
+
+
+def patterns(x):
+    return [r.pattern for r in x.rows], [c.pattern for c in x.cols]
+
+
+def solutions(x):
+    rows, cols = patterns(x)
+    return count_solutions(x.width, x.height, [[r] for r in rows],
+                           [[c] for c in cols])
+
+
+class NoTightening(RegexCrosswordGenerator):
+    TIGHTEN_ROUNDS_PER_CELL = 0
+    MAX_UNIQUE_RESTARTS = 0
+
+
+class ValidateTest(unittest.TestCase):
+
+    def test_clue_matches_whole_strings(self):
+        clue = Clue("A|AB")
+        self.assertTrue(clue.match("AB"))
+        self.assertTrue(clue.match("A"))
+        self.assertFalse(clue.match("ABC"))
+
+    def test_validate_solution(self):
+        before = regex_automaton.cache_stats()["regexes"]
+        x = RegexCrosswordGenerator(5, 4, seed=3)
+        grid = x.possible_solution
+        self.assertTrue(x.validate_solution(grid))
+        self.assertTrue(x.validate_solution([r.lower() for r in grid]))
+        self.assertFalse(x.validate_solution(grid[:-1]))
+        self.assertFalse(x.validate_solution(grid[1:] + grid[:1]))
+        # Generating leaves the cache of the puzzles being played alone.
+        after = regex_automaton.cache_stats()["regexes"]
+        self.assertEqual(after["misses"], before["misses"])
+
+    def test_decoy_differs_from_other(self):
+        x = RegexCrosswordGenerator(3, 3, seed=1)
+        state = x._random.getstate()
+        other = x._decoy_regex("ABC")
+        x._random.setstate(state)
+        retries = x._retries
+        # The same draw again, so the one retry must move it off other.
+        regex = x._decoy_regex("ABC", other=other)
+        self.assertNotEqual(regex.pattern, other.pattern)
+        self.assertTrue(regex.match("ABC"))
+        self.assertEqual(x._retries, retries + 1)
+
+
+class ScoreTest(unittest.TestCase):
+
+    def test_scored_on_demand(self):
+        x = RegexCrosswordGenerator(6, 6, seed=2)
+        self.assertIsNone(x.to_dict()["score"])
+        rows, cols = patterns(x)
+        before = regex_automaton.cache_stats()["automata"]
+        score = difficulty.score(6, 6, [[r] for r in rows],
+                                 [[c] for c in cols])
+        # Scoring leaves the shared automaton cache alone.
+        self.assertEqual(regex_automaton.cache_stats()["automata"], before)
+        self.assertEqual(x.score, score)
+        self.assertEqual(x.to_dict()["score"], round(score, 1))
+
+    def test_unique_scored_by_its_solver(self):
+        x = RegexCrosswordGenerator(6, 6, seed=5, unique=True)
+        self.assertIs(x.unique, True)
+        rows, cols = patterns(x)
+        self.assertEqual(x.score, difficulty.score(
+            6, 6, [[r] for r in rows], [[c] for c in cols]))
+
+
+class TightenTest(unittest.TestCase):
+
+    def test_unique(self):
+        for size in (3, 5, 8):
+            for seed in xrange(3):
+                x = RegexCrosswordGenerator(size, size, seed=seed,
+                                            unique=True)
+                self.assertIs(x.unique, True)
+                self.assertEqual(solutions(x), 1)
+                self.assertTrue(x.puzzle_id.endswith("-u"))
+
+    def test_rebuilt_from_id(self):
+        x = RegexCrosswordGenerator(6, 6, seed=7, unique=True)
+        y = RegexCrosswordGenerator.from_puzzle_id(x.puzzle_id)
+        self.assertEqual(patterns(y), patterns(x))
+        self.assertEqual(y.puzzle_id, x.puzzle_id)
+
+    def test_not_unique(self):
+        # Out of rounds: the clues are put back and the puzzle is not
+        # reported unique.
+        for seed in xrange(20):
+            plain = RegexCrosswordGenerator(6, 6, seed=seed)
+            if solutions(plain) > 1:
+                break
+        x = NoTightening(6, 6, seed=seed, unique=True)
+        self.assertIs(x.unique, False)
+        self.assertEqual(patterns(x), patterns(plain))
+        self.assertEqual(x.puzzle_id, plain.puzzle_id)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- code: utf-8 -*-
+"""
+Solution counts of small hand-made puzzles.
+"""
+from __future__ import print_function
+
+import unittest
+
+from solver import Solver, count_solutions
+
+
+class SolverTest(unittest.TestCase):
+
+    def test_unique(self):
+        rows = [["AB"], ["CD"]]
+        cols = [["AC"], ["BD"]]
+        self.assertEqual(count_solutions(2, 2, rows, cols), 1)
+        self.assertEqual(Solver(2, 2, rows, cols).solve(), [["AB", "CD"]])
+
+    def test_no_solution(self):
+        rows = [["AB"], ["CD"]]
+        cols = [["AD"], ["BC"]]
+        self.assertEqual(count_solutions(2, 2, rows, cols), 0)
+
+    def test_several_solutions(self):
+        # Either letter in every col, as long as it repeats down the col.
+        rows = [["[AB][AB]"], ["[AB]+"]]
+        cols = [["AA|BB"], ["(.)\\1"]]
+        self.assertEqual(count_solutions(2, 2, rows, cols, limit=10), 4)
+        self.assertEqual(count_solutions(2, 2, rows, cols), 2)
+
+    def test_alternatives_narrowed_by_crossing_lines(self):
+        rows = [["A|B|C"], ["X|Y"], ["1|2"]]
+        cols = [["[AB]Y[23456789]"]]
+        self.assertEqual(count_solutions(1, 3, rows, cols, limit=10), 2)
+
+    def test_backreferences(self):
+        rows = [["(.)\\1"], ["(.)\\1"]]
+        cols = [["AB"], ["A."]]
+        self.assertEqual(Solver(2, 2, rows, cols).solve(10), [["AA", "BB"]])
+        cols = [["AB"], ["BA"]]
+        self.assertEqual(count_solutions(2, 2, rows, cols), 0)
+
+    def test_several_clues_per_line(self):
+        rows = [["[ABC]+", ".B"], ["C."]]
+        cols = [["[AC]+", "A."], [".*[^B]"]]
+        # The last cell takes any of the 36 characters but B.
+        self.assertEqual(count_solutions(2, 2, rows, cols, limit=100), 35)
+
+
+if __name__ == "__main__":
+    unittest.main()